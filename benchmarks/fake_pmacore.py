@@ -0,0 +1,201 @@
+"""
+Local stand-in for a PMA.core server, for benchmarking pma_python without a real instance.
+
+It serves the endpoints pma_python uses (tile, thumbnail, barcode, api/json/GetImageInfo, GetFiles, GetDirectories, ...)
+on top of a synthetic directory tree full of synthetic slide pyramids, with configurable latency and bandwidth.
+
+	python benchmarks/fake_pmacore.py --port 54001 --latency 0.02 --bandwidth 12500000
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import BytesIO
+from urllib.parse import urlsplit, parse_qs
+
+from PIL import Image
+
+class FakePmaCore(object):
+	"""Synthetic PMA.core content: a tree of directories with slides, and pre-encoded tiles to serve for them"""
+	def __init__(self, roots = 2, depth = 2, fanout = 3, slides_per_directory = 4, width = 20000, height = 15000, tile_size = 256,
+			channels = 1, layers = 1, latency = 0.0, bandwidth = None, seed = 0, compress = False, chunked = False):
+		self.latency = latency
+		self.bandwidth = bandwidth		# bytes per second per response; None means unlimited
+		self.compress = compress		# gzip JSON and XML responses
+		self.chunked = chunked			# send JSON and XML responses with chunked transfer encoding instead of a Content-Length
+		self.tile_size = tile_size
+		self.directories = dict()		# path => sub-directories
+		self.files = dict()				# path => slides
+		self.slides = dict()			# path => image info
+		self.requests = 0
+		self.failures = 0				# number of upcoming requests to answer with 503 Service Unavailable, to exercise retries
+		self._lock = threading.Lock()
+		rnd = random.Random(seed)
+
+		def populate(path, level):
+			subdirs = [path + "/Dir" + str(i) for i in range(fanout)] if level < depth else []
+			self.directories[path] = subdirs
+			self.files[path] = [path + "/Slide" + str(i) + ".svs" for i in range(slides_per_directory)] if level > 0 else []
+			for slide in self.files[path]:
+				self.slides[slide] = self._info(slide, width, height, channels, layers)
+			for subdir in subdirs:
+				populate(subdir, level + 1)
+
+		self.roots = ["Root" + str(i) for i in range(roots)]
+		for root in self.roots:
+			populate(root, 0)
+
+		# a handful of noisy tiles, so JPEG sizes and decoding cost are realistic without encoding on every request
+		self.tiles = []
+		for i in range(8):
+			img = Image.frombytes("RGB", (tile_size, tile_size), rnd.randbytes(tile_size * tile_size * 3))
+			img = img.resize((tile_size // 4, tile_size // 4)).resize((tile_size, tile_size))
+			self.tiles.append({"jpg": self._encode(img, "JPEG"), "png": self._encode(img, "PNG")})
+		self.thumbnail = self._encode(Image.new("RGB", (300, 200), (230, 180, 200)), "JPEG")
+
+	def _info(self, slide, width, height, channels, layers):
+		maxZoomLevel = int(math.ceil(math.log2(max(width, height) / self.tile_size)))
+		return {"Filename": slide, "UID": hashlib.md5(slide.encode("utf-8")).hexdigest()[:16].upper(),
+			"Width": width, "Height": height, "TileSize": self.tile_size, "MaxZoomLevel": maxZoomLevel, "NumberOfZoomLevels": maxZoomLevel,
+			"MicrometresPerPixelX": 0.25, "MicrometresPerPixelY": 0.25,
+			"TimeFrames": [{"Layers": [{"Channels": [{"Name": "Channel " + str(c)} for c in range(channels)]} for z in range(layers)]}]}
+
+	def _encode(self, img, format):
+		b = BytesIO()
+		img.save(b, format, quality = 90)
+		return b.getvalue()
+
+	def tile(self, slide, x, y, z, format):
+		return self.tiles[hash((slide, x, y, z)) % len(self.tiles)]["png" if format == "png" else "jpg"]
+
+	def count(self):
+		# returns whether this request should fail (see failures)
+		with self._lock:
+			self.requests += 1
+			fail = self.failures > 0
+			self.failures = max(self.failures - 1, 0)
+			return fail
+
+class _Handler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"		# keep-alive, like PMA.core behind IIS
+	# headers and body go out in separate writes; with Nagle's algorithm on, every response would stall on a delayed ACK
+	disable_nagle_algorithm = True
+
+	def log_message(self, format, *args):
+		pass
+
+	def _send(self, body, contentType = "application/json"):
+		if (contentType == "application/json"):
+			body = json.dumps(body).encode("utf-8")
+		elif (contentType == "text/xml"):
+			body = body.encode("utf-8")
+		core = self.server.core
+		text = contentType in ("application/json", "text/xml")
+		if (text and core.compress):
+			body = gzip.compress(body)
+		if (core.bandwidth):
+			time.sleep(len(body) / core.bandwidth)
+		self.send_response(200)
+		self.send_header("Content-Type", contentType)
+		if (text and core.compress):
+			self.send_header("Content-Encoding", "gzip")
+		if (text and core.chunked):
+			self.send_header("Transfer-Encoding", "chunked")
+			self.end_headers()
+			for i in range(0, len(body), 1024):
+				chunk = body[i:i + 1024]
+				self.wfile.write(("%x\r\n" % len(chunk)).encode("ascii") + chunk + b"\r\n")
+			self.wfile.write(b"0\r\n\r\n")
+			return
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		core = self.server.core
+		fail = core.count()
+		if (core.latency):
+			time.sleep(core.latency)
+		if (fail):
+			self.send_response(503)
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+		parts = urlsplit(self.path)
+		q = {k.lower(): v[0] for (k, v) in parse_qs(parts.query).items()}
+		segments = parts.path.strip("/").split("/")
+		endpoint = segments[-1]
+		xml = len(segments) > 1 and segments[-2] == "xml"
+
+		if (endpoint == "IsLite"):
+			return self._send('<?xml version="1.0" encoding="utf-8"?><boolean>false</boolean>', "text/xml") if xml else self._send(False)
+		if (endpoint == "GetVersionInfo"):
+			return self._send("2.0.0.0")
+		if (endpoint == "authenticate"):
+			sessionID = "BENCH" + hashlib.md5(q.get("username", "").encode("utf-8")).hexdigest()[:8]
+			if (xml):
+				return self._send('<?xml version="1.0" encoding="utf-8"?><LoginResult><SessionId>' + sessionID + '</SessionId><Success>true</Success></LoginResult>', "text/xml")
+			return self._send({"Success": True, "SessionId": sessionID, "Username": q.get("username", "")})
+		if (endpoint == "DeAuthenticate"):
+			return self._send(True)
+		if (endpoint == "GetRootDirectories"):
+			return self._send(core.roots)
+		if (endpoint == "GetDirectories"):
+			path = q.get("path", "").strip("/")
+			if (not path in core.directories):
+				return self._send({"Code": "DirectoryNotFound", "Message": "Directory not found"})
+			return self._send(core.directories[path])
+		if (endpoint == "GetFiles"):
+			path = q.get("path", "").strip("/")
+			if (not path in core.files):
+				return self._send({"Code": "DirectoryNotFound", "Message": "Directory not found"})
+			return self._send(core.files[path])
+		if (endpoint in ("GetImageInfo", "GetUID")):
+			slide = (q.get("pathoruid") or q.get("path", "")).strip("/")
+			if (not slide in core.slides):
+				return self._send({"Code": "FileNotFound", "Message": "File not found"})
+			return self._send({"d": core.slides[slide]} if endpoint == "GetImageInfo" else core.slides[slide]["UID"])
+		if (endpoint == "tile"):
+			return self._send(core.tile(q.get("pathoruid"), q.get("x"), q.get("y"), q.get("z"), q.get("format")), "image/jpeg")
+		if (endpoint in ("thumbnail", "barcode")):
+			return self._send(core.thumbnail, "image/jpeg")
+		self.send_response(404)
+		self.send_header("Content-Length", "0")
+		self.end_headers()
+
+class _Server(ThreadingHTTPServer):
+	# the default listen backlog of 5 drops connections when many are opened at once, stalling the client for a second or more
+	request_queue_size = 256
+
+def start(core, host = "127.0.0.1", port = 0):
+	"""Serve core from a background thread; returns (server, base URL)"""
+	server = _Server((host, port), _Handler)
+	server.daemon_threads = True
+	server.core = core
+	threading.Thread(target = server.serve_forever, daemon = True).start()
+	return server, "http://" + host + ":" + str(server.server_address[1]) + "/"
+
+def serve(connection, **options):
+	"""Entry point for running the server in a separate process: sends the base URL back over connection, then serves forever"""
+	server, url = start(FakePmaCore(**options))
+	connection.send(url)
+	threading.Event().wait()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--port", type = int, default = 54001)
+	parser.add_argument("--latency", type = float, default = 0.0, help = "seconds added to every request")
+	parser.add_argument("--bandwidth", type = float, default = None, help = "bytes per second per response")
+	parser.add_argument("--width", type = int, default = 20000)
+	parser.add_argument("--height", type = int, default = 15000)
+	parser.add_argument("--tile-size", type = int, default = 256)
+	args = parser.parse_args()
+	server, url = start(FakePmaCore(width = args.width, height = args.height, tile_size = args.tile_size,
+		latency = args.latency, bandwidth = args.bandwidth), port = args.port)
+	print("Fake PMA.core listening on", url)
+	threading.Event().wait()
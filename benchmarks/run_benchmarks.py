@@ -0,0 +1,197 @@
+"""
+Benchmark pma_python against a local stand-in PMA.core server (see fake_pmacore.py).
+
+The server runs in a separate process, and so does every benchmark, so the client's CPU time and memory are measured on their own.
+Every benchmark reports throughput, per-request latency percentiles (per endpoint), bytes transferred and client CPU/memory;
+the results are written as JSON so that runs of different versions can be compared:
+
+	python benchmarks/run_benchmarks.py --latency 0.02 --output before.json
+	python benchmarks/run_benchmarks.py --latency 0.02 --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import pma_python.pma as pma
+import fake_pmacore
+
+try:
+	import resource
+except ImportError:
+	resource = None		# not available on Windows; memory is then not reported
+
+def _max_rss():
+	if (resource is None):
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss if sys.platform == "darwin" else rss * 1024		# bytes on macOS, kilobytes elsewhere
+
+def _bytes(sessionID):
+	return sum(m["bytes"] for m in pma.get_metrics(sessionID).values())
+
+def measure(name, sessionID, run):
+	"""
+	run() returns an iterable of the items a benchmark fetches.
+	Latency is that of the individual requests, as recorded by pma.get_metrics, so it means the same for serial and concurrent benchmarks
+	"""
+	pma.reset_metrics()
+	rss = _max_rss()
+	items = 0
+	cpu, start = time.process_time(), time.perf_counter()
+	for item in run():
+		items += 1
+	seconds = time.perf_counter() - start
+	metrics = pma.get_metrics(sessionID)
+	return {"name": name, "items": items, "seconds": seconds,
+		"items_per_second": items / seconds if seconds > 0 else None,
+		"request_latency": {endpoint: {"p50": m["p50_seconds"], "p90": m["p90_seconds"], "p99": m["p99_seconds"]} for (endpoint, m) in metrics.items()},
+		"bytes": _bytes(sessionID), "requests": sum(m["requests"] for m in metrics.values()),
+		# ru_maxrss is a high-water mark, hence every benchmark runs in a process of its own (see run_one)
+		"cpu_seconds": time.process_time() - cpu, "max_rss_bytes": _max_rss(),
+		"rss_growth_bytes": None if rss is None else _max_rss() - rss}
+
+def forget_slide_info(sessionID):
+	pma.invalidate_slide_info(sessionID = sessionID)
+
+def benchmarks(sessionID, slide, slides, args):
+	"""Yields (name, run) for every benchmark; see measure"""
+	zoomlevel = pma.get_max_zoomlevel(slide, sessionID)
+	(xtiles, ytiles, ntiles) = pma.get_number_of_tiles(slide, zoomlevel, sessionID)
+	toX, toY = min(xtiles, args.tiles_x), min(ytiles, args.tiles_y)
+	tileSize = pma.get_tile_size(sessionID, slide)[0]
+
+	def tile_by_tile():
+		for x in range(toX):
+			for y in range(toY):
+				yield pma.get_tile(slide, x, y, zoomlevel, sessionID).load()
+	yield ("get_tile", tile_by_tile)
+
+	yield ("get_tiles", lambda: pma.get_tiles(slide, 0, 0, toX, toY, zoomlevel, sessionID))
+	yield ("get_tiles[workers=%d]" % args.workers,
+		lambda: pma.get_tiles(slide, 0, 0, toX, toY, zoomlevel, sessionID, workers = args.workers))
+	yield ("get_tiles[workers=%d,unordered]" % args.workers,
+		lambda: pma.get_tiles(slide, 0, 0, toX, toY, zoomlevel, sessionID, workers = args.workers, ordered = False))
+
+	yield ("get_tiles[workers=%d,output=bytes]" % args.workers,
+		lambda: pma.get_tiles(slide, 0, 0, toX, toY, zoomlevel, sessionID, workers = args.workers, output = "bytes"))
+
+	if not (pma.np is None):
+		yield ("get_tiles[workers=%d,output=numpy]" % args.workers,
+			lambda: pma.get_tiles(slide, 0, 0, toX, toY, zoomlevel, sessionID, workers = args.workers, output = "numpy"))
+		yield ("get_region",
+			lambda: [pma.get_region(slide, tileSize // 2, tileSize // 2, (toX - 1) * tileSize, (toY - 1) * tileSize, zoomlevel, sessionID = sessionID, workers = args.workers)])
+
+	if not (pma.aiohttp is None):
+		def async_tiles():
+			async def collect():
+				tiles = [t async for t in pma.aget_tiles(slide, 0, 0, toX, toY, zoomlevel, sessionID, prefetch = args.workers * 4)]
+				await pma.aclose_connections()
+				return tiles
+			return asyncio.run(collect())
+		yield ("aget_tiles", async_tiles)
+
+	def slide_info():
+		forget_slide_info(sessionID)
+		for s in slides:
+			yield pma.get_slide_info(s, sessionID)
+	yield ("get_slide_info", slide_info)
+
+	def prefetched_slide_info():
+		forget_slide_info(sessionID)
+		pma.prefetch_slide_info(slides, sessionID, workers = args.workers)
+		for s in slides:
+			yield pma.get_slide_info(s, sessionID)
+	yield ("prefetch_slide_info[workers=%d]" % args.workers, prefetched_slide_info)
+
+	def geometry():
+		for s in slides:
+			pma.get_zoomlevels_dict(s, sessionID)
+			pma.get_pixels_per_micrometer(s, 0, sessionID)
+			yield pma.get_number_of_tiles(s, None, sessionID)
+	yield ("geometry helpers", geometry)
+
+	def serial_walk(directories):
+		for directory in directories:
+			for s in pma.get_slides(directory, sessionID):
+				yield s
+			for s in serial_walk(pma.get_directories(directory, sessionID)):
+				yield s
+	yield ("directory walk (serial)", lambda: serial_walk(pma.get_root_directories(sessionID)))
+	yield ("walk_slides[workers=%d]" % args.workers, lambda: pma.walk_slides(sessionID = sessionID, workers = args.workers))
+
+def _connect(url, args):
+	pma.set_connection_options(pool_size = max(args.workers, 16))
+	sessionID = pma.connect(url, "benchmark", "benchmark")
+	slides = list(pma.walk_slides(sessionID = sessionID))
+	return (sessionID, slides, list(benchmarks(sessionID, sorted(slides)[0], slides, args)))
+
+def run_one(connection, url, index, args):
+	"""Entry point of the process that runs benchmark number index; sends its results back over connection"""
+	(sessionID, slides, runs) = _connect(url, args)
+	(name, run) = runs[index]
+	connection.send(measure(name, sessionID, run))
+	pma.disconnect(sessionID)
+
+def compare(results, baseline):
+	"""Print the relative change in throughput and client CPU of every benchmark present in both runs"""
+	before = {r["name"]: r for r in baseline["results"]}
+	print("%-40s %12s %12s" % ("benchmark", "items/s", "cpu"))
+	for r in results["results"]:
+		b = before.get(r["name"])
+		if (b is None or not b["items_per_second"] or not b["cpu_seconds"]):
+			continue
+		print("%-40s %+11.1f%% %+11.1f%%" % (r["name"], 100.0 * (r["items_per_second"] / b["items_per_second"] - 1), 100.0 * (r["cpu_seconds"] / b["cpu_seconds"] - 1)))
+
+def main():
+	parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--latency", type = float, default = 0.01, help = "seconds the server adds to every request")
+	parser.add_argument("--bandwidth", type = float, default = None, help = "bytes per second per response (default: unlimited)")
+	parser.add_argument("--tile-size", type = int, default = 256)
+	parser.add_argument("--tiles-x", type = int, default = 16, help = "width, in tiles, of the area read by the tile benchmarks")
+	parser.add_argument("--tiles-y", type = int, default = 16, help = "height, in tiles, of the area read by the tile benchmarks")
+	parser.add_argument("--depth", type = int, default = 2, help = "depth of the synthetic directory tree")
+	parser.add_argument("--fanout", type = int, default = 3, help = "sub-directories per directory")
+	parser.add_argument("--workers", type = int, default = 8)
+	parser.add_argument("--output", default = None, help = "write the results to this JSON file (default: stdout)")
+	parser.add_argument("--compare", default = None, help = "JSON results of an earlier run to compare against")
+	args = parser.parse_args()
+
+	options = dict(depth = args.depth, fanout = args.fanout, tile_size = args.tile_size, latency = args.latency, bandwidth = args.bandwidth)
+	(parent, child) = multiprocessing.Pipe()
+	server = multiprocessing.Process(target = fake_pmacore.serve, args = (child, ), kwargs = options, daemon = True)
+	server.start()
+	try:
+		url = parent.recv()
+		(sessionID, slides, runs) = _connect(url, args)
+		pma.disconnect(sessionID)
+		results = {"version": pma.__version__, "python": platform.python_version(), "platform": platform.platform(),
+			"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "options": vars(args), "results": []}
+		# a fresh (spawned, not forked) process per benchmark, so its memory use isn't inflated by the ones before it
+		spawn = multiprocessing.get_context("spawn")
+		for index in range(len(runs)):
+			(receiver, sender) = spawn.Pipe()
+			worker = spawn.Process(target = run_one, args = (sender, url, index, args))
+			worker.start()
+			results["results"].append(receiver.recv())
+			worker.join()
+	finally:
+		server.terminate()
+
+	text = json.dumps(results, indent = 1)
+	if (args.output is None):
+		print(text)
+	else:
+		with open(args.output, "w") as f:
+			f.write(text)
+	if not (args.compare is None):
+		with open(args.compare) as f:
+			compare(results, json.load(f))
+
+if __name__ == "__main__":
+	main()
@@ -1,92 +1,81 @@
 import os
+import asyncio
+import atexit
+import hashlib
+import multiprocessing
+import queue
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 from math import ceil
 from PIL import Image
-from random import choice
+from random import choice, Random
 from io import BytesIO
-from urllib.parse import quote
-from urllib.request import urlopen
-from xml.dom import minidom
+from json import dumps as _pma_dumps, loads as _pma_loads
+from urllib.parse import quote, urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+	import numpy as np
+except ImportError:
+	# region reads (get_region) are optional and need numpy
+	np = None
+try:
+	import aiohttp
+except ImportError:
+	# the asyncio API (aget_tile, aget_tiles, ...) is optional and needs aiohttp
+	aiohttp = None
 
 __version__ = "2.0.0.33"
 
+# the public API, so that "from pma_python import *" doesn't also hand out the modules and helpers imported above
+__all__ = ["PMAClient", "SlideCatalog", "SlideGeometry", "get_default_client", "open_level", "set_decode_processes",
+	"get_slide_file_extension", "get_slide_file_name", "who_am_i", "is_lite", "get_version_info", "set_connection_options",
+	"connect", "disconnect", "connect_replicas", "get_replica_status", "get_worker_state", "init_worker", "get_root_directories",
+	"get_directories", "get_first_non_empty_directory", "get_slides", "walk_slides", "get_uid", "sessions", "get_tile_size",
+	"get_slide_info", "set_slide_info_cache", "invalidate_slide_info", "prefetch_slide_info", "get_slide_geometry",
+	"get_max_zoomlevel", "get_zoomlevels_list", "get_zoomlevels_dict", "get_pixels_per_micrometer", "get_pixel_dimensions",
+	"get_number_of_tiles", "get_physical_dimensions", "get_number_of_channels", "get_number_of_layers", "is_fluorescent",
+	"is_multi_layer", "is_z_stack", "get_magnification", "get_metrics", "reset_metrics", "add_request_hook", "remove_request_hook",
+	"set_tile_disk_cache", "get_tile_disk_cache_stats", "clear_tile_disk_cache", "set_tile_memory_cache",
+	"get_tile_memory_cache_stats", "clear_tile_memory_cache", "set_tile_hedging", "get_barcode_url", "get_barcode_image",
+	"get_label_url", "get_label_image", "get_thumbnail_url", "get_thumbnail_image", "get_thumbnails", "get_labels",
+	"get_thumbnail_stack", "get_contact_sheet", "get_tile_url", "get_tile", "get_tiles", "get_tiles_coarse_to_fine",
+	"get_zoomlevel_for_mpp", "get_region", "get_region_stack", "get_tile_stack", "get_tissue_mask", "get_tissue_tiles",
+	"sample_patches", "export_level", "export_pyramid", "show_slide", "aclose_connections", "aget_directories", "aget_slides",
+	"aget_slide_info", "aget_tile", "aget_tiles"]
+
 # internal module helper variables and functions
-_pma_sessions = dict()
-_pma_slideinfos = dict()
 _pma_pmacoreliteURL = "http://localhost:54001/"
 _pma_pmacoreliteSessionID = "SDK.Python"
 _pma_usecachewhenretrievingtiles = True
-_pma_amount_of_data_downloaded = {_pma_pmacoreliteSessionID: 0}
+_pma_process_decoder = None		# see set_decode_processes()
+_pma_latency_buckets = [0.001 * 2 ** i for i in range(0, 17)]	# 1 ms up to ~65 s
+_pma_lock = threading.RLock()		# guards process-wide state; everything else belongs to a PMAClient
+_pma_clients = weakref.WeakSet()	# every PMAClient, so they can be made safe to use in a forked child (see _pma_after_fork)
+_pma_inherited = []					# objects a forked child inherited from its parent and mustn't finalize (see PMAClient._after_fork)
 
-def _pma_session_id(sessionID = None):
-	if (sessionID is None):
-		# if the sessionID isn't specified, maybe we can still recover it somehow
-		return _pma_first_session_id()
-	else:
-		# nothing to do in this case; a SessionID WAS passed along, so just continue using it
-		return sessionID
-		
-def _pma_first_session_id():
-	# do we have any stored sessions from earlier login events?
-	global _pma_sessions
-	global _pma_slideinfos
-	
-	if (len(_pma_sessions.keys()) > 0):
-		# yes we do! This means that when there's a PMA.core active session AND PMA.core.lite version running, 
-		# the PMA.core active will be selected and returned
-		return list(_pma_sessions.keys())[0]
-	else:
-		# ok, we don't have stored sessions; not a problem per se...
-		if (_pma_is_lite()):
-			if (not _pma_pmacoreliteSessionID in _pma_slideinfos):
-				# _pma_sessions[_pma_pmacoreliteSessionID] = _pma_pmacoreliteURL
-				
-				_pma_slideinfos[_pma_pmacoreliteSessionID] = dict()
-			return _pma_pmacoreliteSessionID
-		else:
-			# no stored PMA.core sessions found NOR PMA.core.lite
-			return None
-	
-def _pma_url(sessionID = None):	
-	sessionID = _pma_session_id(sessionID)
-	if sessionID is None:
-		# sort of a hopeless situation; there is no URL to refer to
-		return None
-	elif sessionID == _pma_pmacoreliteSessionID:
-		return _pma_pmacoreliteURL
-	else:
-		# assume sessionID is a valid session; otherwise the following will generate an error
-		if sessionID in _pma_sessions.keys():
-			url = _pma_sessions[sessionID]
-			if (not url.endswith("/")):
-				url = url + "/"
-			return url
-		else:
-			raise Exception("Invalid sessionID:", sessionID)
+def _pma_endpoint(url):
+	# the last part of the path identifies the endpoint: tile, thumbnail, GetImageInfo, GetFiles, ...
+	return urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1]
+
+def _pma_json_result(json):
+	# PMA.core (depending on the version) may wrap its JSON answers in a {"d": ...} envelope
+	if (isinstance(json, dict) and "d" in json):
+		return json["d"]
+	return json
 
-def _pma_is_lite(pmacoreURL = _pma_pmacoreliteURL):
-	url = _pma_join(pmacoreURL, "api/xml/IsLite")
-	try:
-		contents = urlopen(url).read()
-	except Exception as e:
-		# this happens when NO instance of PMA.core is detected
-		return None
-	dom = minidom.parseString(contents)	
-	return str(dom.firstChild.firstChild.nodeValue).lower() == "true"
-
-def _pma_api_url(sessionID = None, xml = True):
-	# let's get the base URL first for the specified session
-	url = _pma_url(sessionID)
-	if url is None:
-		# sort of a hopeless situation; there is no URL to refer to
-		return None
-	# remember, _pma_url is guaranteed to return a URL that ends with "/"
-	if (xml == True):
-		return _pma_join(url, "api/xml/")
-	else:
-		return _pma_join(url, "api/json/")
-	
 def _pma_join(*s):
 	joinstring = ""
 	for ss in s:
@@ -94,482 +83,2806 @@ def _pma_join(*s):
 			joinstring = os.path.join(joinstring, ss)
 	return joinstring.replace("\\", "/")
 	
-def _pma_XmlToStringArray(root, limit = 0):
-	els = root.getElementsByTagName("string")
-	l = []
-	if (limit > 0):
-		for el in els[0: limit]:
-			l.append(el.firstChild.nodeValue)
+def _pma_imap(func, items, workers = 1, prefetch = None, ordered = True):
+	# lazily map func over items on a pool of threads, yielding (item, result) pairs
+	# at most prefetch calls are in flight or waiting to be consumed, so memory stays bounded when the consumer is slow
+	# ordered = True yields in the order of items, otherwise results are yielded as soon as they complete
+	if (prefetch is None):
+		prefetch = 2 * workers
+	prefetch = max(prefetch, 1)
+	items = iter(items)
+	pending = deque()
+	executor = ThreadPoolExecutor(max_workers = max(workers, 1))
+	try:
+		for item in islice(items, prefetch):
+			pending.append((item, executor.submit(func, item)))
+		while (len(pending) > 0):
+			if (ordered):
+				item, future = pending.popleft()
+				result = future.result()
+			else:
+				wait([f for (i, f) in pending], return_when = FIRST_COMPLETED)
+				idx = next(i for i, (it, f) in enumerate(pending) if f.done())
+				item, future = pending[idx]
+				del pending[idx]
+				result = future.result()
+			# top up the pipeline before handing the result over, so the workers stay busy while the consumer is
+			for nextItem in islice(items, 1):
+				pending.append((nextItem, executor.submit(func, nextItem)))
+			yield (item, result)
+	finally:
+		for (item, future) in pending:
+			future.cancel()
+		executor.shutdown(wait = False)
+
+async def _pma_aio_imap(coroutine_func, items, prefetch = 16, ordered = True):
+	# asyncio counterpart of _pma_imap: at most prefetch coroutines are scheduled ahead of the consumer
+	prefetch = max(prefetch, 1)
+	items = iter(items)
+	pending = deque()
+	try:
+		for item in islice(items, prefetch):
+			pending.append((item, asyncio.ensure_future(coroutine_func(item))))
+		while (len(pending) > 0):
+			if (ordered):
+				item, task = pending.popleft()
+				result = await task
+			else:
+				await asyncio.wait([t for (i, t) in pending], return_when = asyncio.FIRST_COMPLETED)
+				idx = next(i for i, (it, t) in enumerate(pending) if t.done())
+				item, task = pending[idx]
+				del pending[idx]
+				result = task.result()
+			for nextItem in islice(items, 1):
+				pending.append((nextItem, asyncio.ensure_future(coroutine_func(nextItem))))
+			yield (item, result)
+	finally:
+		for (item, task) in pending:
+			task.cancel()
+
+class _PmaEndpointMetrics(object):
+	# Counters and a latency histogram for one (session, endpoint) pair; callers hold the lock of their PMAClient
+	# bucket i counts requests that took up to _pma_latency_buckets[i] seconds; the last bucket is open-ended
+	def __init__(self):
+		self.requests = 0
+		self.errors = 0
+		self.retries = 0
+		self.bytes = 0
+		self.seconds = 0.0
+		self.max_seconds = 0.0
+		self.cache_hits = dict()	# kind of cache (memory, disk) => number of hits
+		self.coalesced = 0			# calls that shared the result of an identical request already in flight
+		self.hedged = 0				# requests that were duplicated because they took too long
+		self.histogram = [0] * (len(_pma_latency_buckets) + 1)
+
+	def record(self, status, nbytes, seconds, retries, error):
+		self.requests += 1
+		self.retries += retries
+		self.bytes += nbytes
+		self.seconds += seconds
+		self.max_seconds = max(self.max_seconds, seconds)
+		if not (error is None) or status is None or status >= 400:
+			self.errors += 1
+		self.histogram[bisect_left(_pma_latency_buckets, seconds)] += 1
+
+	def percentile(self, p):
+		# upper bound of the bucket holding the p-th percentile (at most the slowest request actually seen)
+		if (self.requests == 0):
+			return None
+		rank = p / 100.0 * self.requests
+		seen = 0
+		for (i, count) in enumerate(self.histogram):
+			seen += count
+			if (seen >= rank and count > 0):
+				return min(_pma_latency_buckets[i], self.max_seconds) if i < len(_pma_latency_buckets) else self.max_seconds
+		return self.max_seconds
+
+	def snapshot(self):
+		return {"requests": self.requests, "errors": self.errors, "retries": self.retries, "bytes": self.bytes,
+			"cache_hits": dict(self.cache_hits), "coalesced": self.coalesced, "hedged": self.hedged,
+			"mean_seconds": (self.seconds / self.requests) if self.requests > 0 else None,
+			"p50_seconds": self.percentile(50), "p90_seconds": self.percentile(90), "p99_seconds": self.percentile(99),
+			"max_seconds": self.max_seconds,
+			"histogram": list(zip(_pma_latency_buckets + [None], self.histogram))}
+
+class _PmaDiskCache(object):
+	# Size-bounded store of encoded images (tiles, thumbnails, labels) on local disk.
+	# Entries are written to a temporary file and renamed into place, so any number of processes can share a directory;
+	# a hit refreshes the file's modification time, which is what eviction uses to discard the least recently used entries.
+	def __init__(self, directory, max_bytes):
+		self.directory = directory
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._lock = threading.Lock()
+		os.makedirs(directory, exist_ok = True)
+		# running estimate of the size on disk; other processes add to it too, so it's re-measured on every eviction
+		self._size = sum(size for (mtime, size, path) in self._entries())
+
+	def _path(self, key):
+		digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+		return os.path.join(self.directory, digest[:2], digest)
+
+	def _entries(self):
+		entries = []
+		for sub in os.scandir(self.directory):
+			if (not sub.is_dir()):
+				continue
+			for entry in os.scandir(sub.path):
+				if (entry.name.startswith(".")):
+					continue	# a write in progress
+				try:
+					st = entry.stat()
+				except FileNotFoundError:
+					continue	# evicted by another process in the meantime
+				entries.append((st.st_mtime, st.st_size, entry.path))
+		return entries
+
+	def get(self, key):
+		path = self._path(key)
+		try:
+			with open(path, "rb") as f:
+				content = f.read()
+			os.utime(path, None)
+		except OSError:
+			with self._lock:
+				self.misses += 1
+			return None
+		with self._lock:
+			self.hits += 1
+		return content
+
+	def put(self, key, content):
+		path = self._path(key)
+		try:
+			os.makedirs(os.path.dirname(path), exist_ok = True)
+			fd, tmp = tempfile.mkstemp(dir = os.path.dirname(path), prefix = ".")
+			with os.fdopen(fd, "wb") as f:
+				f.write(content)
+			os.replace(tmp, path)
+		except OSError:
+			# the cache is an optimization; failing to store an entry must not fail the request
+			try:
+				os.remove(tmp)
+			except (OSError, NameError):
+				pass
+			return
+		with self._lock:
+			self._size += len(content)
+			mustEvict = self._size > self.max_bytes
+		if (mustEvict):
+			self.evict()
+
+	def evict(self):
+		# drop least recently used entries until we're 10% below budget, so eviction doesn't run on every write
+		entries = sorted(self._entries())
+		total = sum(size for (mtime, size, path) in entries)
+		evicted = 0
+		for (mtime, size, path) in entries:
+			if (total <= 0.9 * self.max_bytes):
+				break
+			try:
+				os.remove(path)
+				evicted += 1
+			except FileNotFoundError:
+				pass
+			total -= size
+		with self._lock:
+			self._size = total
+			self.evictions += evicted
+
+	def clear(self):
+		for (mtime, size, path) in self._entries():
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+		with self._lock:
+			self._size = 0
+
+	def stats(self):
+		with self._lock:
+			lookups = self.hits + self.misses
+			return {"directory": self.directory, "max_bytes": self.max_bytes, "bytes": self._size,
+				"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+				"hit_rate": (self.hits / lookups) if lookups > 0 else 0.0}
+
+class _PmaSingleFlight(object):
+	# Makes concurrent calls for the same key share one execution: whoever comes first runs it,
+	# callers arriving while it's in flight wait for (and get) the same result or exception
+	def __init__(self):
+		self._calls = dict()		# key => Future
+		self._lock = threading.Lock()
+
+	def do(self, key, func):
+		# returns (result, whether it was shared from another caller's execution)
+		with self._lock:
+			future = self._calls.get(key)
+			leader = future is None
+			if (leader):
+				future = self._calls[key] = Future()
+		if (not leader):
+			return (future.result(), True)
+		try:
+			result = func()
+		except BaseException as e:
+			future.set_exception(e)
+			raise
+		else:
+			future.set_result(result)
+			return (result, False)
+		finally:
+			with self._lock:
+				del self._calls[key]
+
+class _PmaMemoryCache(object):
+	# Thread-safe LRU of decoded images, bounded by the (approximate) number of bytes their pixels occupy
+	def __init__(self, max_bytes):
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._size = 0
+		self._entries = OrderedDict()		# key => (value, size), least recently used first
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			if (entry is None):
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry[0]
+
+	def put(self, key, value, size):
+		if (size > self.max_bytes):
+			return
+		with self._lock:
+			old = self._entries.pop(key, None)
+			if not (old is None):
+				self._size -= old[1]
+			self._entries[key] = (value, size)
+			self._size += size
+			while (self._size > self.max_bytes):
+				(value, size) = self._entries.popitem(last = False)[1]
+				self._size -= size
+				self.evictions += 1
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._size = 0
+
+	def stats(self):
+		with self._lock:
+			lookups = self.hits + self.misses
+			return {"entries": len(self._entries), "max_bytes": self.max_bytes, "bytes": self._size,
+				"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+				"hit_rate": (self.hits / lookups) if lookups > 0 else 0.0}
+
+class _PmaSlideInfoCache(object):
+	# Per-session LRU of slide information, bounded in number of entries and optionally expiring after ttl seconds;
+	# the SlideGeometry derived from the information is kept (and expires) along with it
+	def __init__(self, max_entries, ttl = None):
+		self.max_entries = max_entries
+		self.ttl = ttl
+		self._entries = OrderedDict()		# slideRef => [info, time stored, SlideGeometry or None], least recently used first
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def _entry(self, slideRef):
+		entry = self._entries.get(slideRef)
+		if (entry is None):
+			return None
+		if (not (self.ttl is None) and time.time() - entry[1] > self.ttl):
+			del self._entries[slideRef]
+			return None
+		self._entries.move_to_end(slideRef)
+		return entry
+
+	def get(self, slideRef):
+		with self._lock:
+			entry = self._entry(slideRef)
+			return None if entry is None else entry[0]
+
+	def get_geometry(self, slideRef):
+		with self._lock:
+			entry = self._entry(slideRef)
+			return None if entry is None else entry[2]
+
+	def put(self, slideRef, info):
+		with self._lock:
+			self._entries[slideRef] = [info, time.time(), None]
+			self._entries.move_to_end(slideRef)
+			self._trim()
+
+	def set_geometry(self, slideRef, geometry):
+		with self._lock:
+			entry = self._entries.get(slideRef)
+			if not (entry is None):
+				entry[2] = geometry
+
+	def configure(self, max_entries, ttl):
+		with self._lock:
+			self.max_entries = max_entries
+			self.ttl = ttl
+			self._trim()
+
+	def _trim(self):
+		while (len(self._entries) > self.max_entries):
+			self._entries.popitem(last = False)
+
+	def invalidate(self, slideRef = None):
+		with self._lock:
+			if (slideRef is None):
+				self._entries.clear()
+			else:
+				self._entries.pop(slideRef, None)
+
+	def values(self):
+		with self._lock:
+			return [entry[0] for entry in self._entries.values()]
+
+	def items(self):
+		with self._lock:
+			return [(slideRef, entry[0]) for (slideRef, entry) in self._entries.items()]
+
+class _PmaSlideInfoStore(object):
+	# sqlite-backed slide information that survives restarts; information is keyed by PMA.core instance and slide UID,
+	# with a separate table to resolve the paths it was requested by
+	def __init__(self, path):
+		self.path = path
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+		with self._lock, self._db:
+			self._db.execute("PRAGMA journal_mode=WAL")
+			self._db.execute("CREATE TABLE IF NOT EXISTS slideinfo (server TEXT, uid TEXT, info TEXT, stored REAL, PRIMARY KEY (server, uid))")
+			self._db.execute("CREATE TABLE IF NOT EXISTS slidepath (server TEXT, path TEXT, uid TEXT, PRIMARY KEY (server, path))")
+
+	def get(self, server, slideRef, ttl = None):
+		with self._lock:
+			if (self._db is None):
+				return None
+			row = self._db.execute("SELECT i.info, i.stored FROM slidepath p JOIN slideinfo i ON i.server = p.server AND i.uid = p.uid "
+				+ "WHERE p.server = ? AND p.path = ?", (server, slideRef)).fetchone()
+		if (row is None or (not (ttl is None) and time.time() - row[1] > ttl)):
+			return None
+		return _pma_loads(row[0])
+
+	def put(self, server, slideRef, uid, info):
+		with self._lock:
+			if (self._db is None):
+				return
+			with self._db:
+				self._db.execute("INSERT OR REPLACE INTO slideinfo VALUES (?, ?, ?, ?)", (server, uid, _pma_dumps(info), time.time()))
+				self._db.execute("INSERT OR REPLACE INTO slidepath VALUES (?, ?, ?)", (server, slideRef, uid))
+
+	def invalidate(self, server, slideRef = None):
+		with self._lock:
+			if (self._db is None):
+				return
+			with self._db:
+				if (slideRef is None):
+					self._db.execute("DELETE FROM slideinfo WHERE server = ?", (server, ))
+					self._db.execute("DELETE FROM slidepath WHERE server = ?", (server, ))
+				else:
+					self._db.execute("DELETE FROM slideinfo WHERE server = ? AND uid IN (SELECT uid FROM slidepath WHERE server = ? AND path = ?)", (server, server, slideRef))
+					self._db.execute("DELETE FROM slidepath WHERE server = ? AND path = ?", (server, slideRef))
+
+	def close(self):
+		# waits for a get/put/invalidate in progress on another thread; calls made after this find no database and do nothing
+		with self._lock:
+			if not (self._db is None):
+				self._db.close()
+				self._db = None
+
+class _PmaReplica(object):
+	# One PMA.core node of a replica set, with the session it was authenticated with and its health statistics
+	def __init__(self, url, sessionID):
+		self.url = url if url.endswith("/") else url + "/"
+		self.sessionID = sessionID
+		self.outstanding = 0		# requests in flight
+		self.latency = None			# exponentially weighted moving average, in seconds
+		self.failures = 0			# consecutive failures
+		self.ejected_until = None	# time at which an ejected node is due for a health check
+		self.probing = False
+		self.requests = 0
+		self.errors = 0
+
+class _PmaReplicaSet(object):
+	# Several PMA.core nodes serving the same content behind one logical session (see PMAClient.connect_replicas).
+	# Requests go to the healthy node with the shortest expected wait; nodes that fail max_errors times in a row are
+	# ejected for eject_seconds, after which they're health-checked (and re-authenticated) before taking traffic again
+	def __init__(self, sessionID, replicas, username, password, max_errors = 3, eject_seconds = 10):
+		self.sessionID = sessionID
+		self.replicas = replicas
+		self.username = username
+		self.password = password
+		self.max_errors = max_errors
+		self.eject_seconds = eject_seconds
+		self._lock = threading.Lock()
+		self._base = replicas[0].url
+		self._sessionPattern = re.compile("(?i)(sessionid=)" + re.escape(_pma_q(sessionID)) + "(?=&|$)")
+
+	def rewrite(self, url, replica):
+		# requests are built against the first node and the logical session; point them at replica instead
+		if (url.startswith(self._base)):
+			url = replica.url + url[len(self._base):]
+		return self._sessionPattern.sub(lambda m: m.group(1) + _pma_q(replica.sessionID), url)
+
+	def acquire(self, exclude):
+		# None when every node with a session is in exclude
+		with self._lock:
+			candidates = [r for r in self.replicas if not r in exclude and not (r.sessionID is None)]
+			if (len(candidates) == 0):
+				return None
+			healthy = [r for r in candidates if r.ejected_until is None]
+			# when every node is ejected, trying one beats failing right away
+			replica = min(healthy or candidates, key = lambda r: ((r.outstanding + 1) * (r.latency or 0.0), r.outstanding))
+			replica.outstanding += 1
+			return replica
+
+	def release(self, replica, seconds, ok):
+		with self._lock:
+			replica.outstanding -= 1
+			replica.requests += 1
+			if (ok):
+				replica.failures = 0
+				replica.latency = seconds if replica.latency is None else 0.8 * replica.latency + 0.2 * seconds
+			else:
+				replica.errors += 1
+				replica.failures += 1
+				if (replica.failures >= self.max_errors and replica.ejected_until is None):
+					replica.ejected_until = time.time() + self.eject_seconds
+
+	def any_due(self):
+		# cheap test whether due_for_check has anything to hand out
+		now = time.time()
+		with self._lock:
+			return any(not (r.ejected_until is None) and r.ejected_until <= now and not r.probing for r in self.replicas)
+
+	def due_for_check(self):
+		# ejected nodes whose time is up; each is handed to one caller only
+		with self._lock:
+			due = [r for r in self.replicas if not (r.ejected_until is None) and r.ejected_until <= time.time() and not r.probing]
+			for r in due:
+				r.probing = True
+			return due
+
+	def checked(self, replica, sessionID):
+		with self._lock:
+			replica.probing = False
+			if (sessionID is None):
+				replica.ejected_until = time.time() + self.eject_seconds
+			else:
+				replica.sessionID = sessionID
+				replica.ejected_until = None
+				replica.failures = 0
+				replica.latency = None
+
+	def status(self):
+		with self._lock:
+			return [{"url": r.url, "sessionID": r.sessionID, "healthy": r.ejected_until is None and not (r.sessionID is None),
+				"outstanding": r.outstanding, "latency": r.latency, "requests": r.requests, "errors": r.errors} for r in self.replicas]
+
+def _pma_wire_bytes(headers, content, raw = None):
+	# size of a response body as transferred, i.e. before any content-encoding (gzip, ...) was undone
+	chunked = "chunked" in headers.get("Transfer-Encoding", "").lower()
+	if not (raw is None) and hasattr(raw, "tell"):
+		# urllib3 counts the bytes it read off the connection, except those of chunked responses, for which it reports 0
+		nbytes = raw.tell()
+		if (nbytes > 0 or (not chunked and len(content) == 0)):
+			return nbytes
+	if (not headers.get("Content-Encoding")):
+		return len(content)
+	length = headers.get("Content-Length")
+	# an encoded, chunked response doesn't say how big it was on the wire; its decoded size is the best there is
+	return int(length) if length else len(content)
+
+def _pma_check_image_status(url, slideRef, status):
+	# an image endpoint answering anything but 200 has no image to give; its body (often empty) mustn't be passed off as one
+	if (status != 200):
+		raise Exception("PMA.core " + _pma_endpoint(url) + " request for " + str(slideRef) + " failed with HTTP status " + str(status))
+
+def _pma_replica_failed(status):
+	# answers that say something is wrong with the node (or our session on it) rather than with the request
+	return status is None or status >= 500 or status in (401, 403)
+
+def _pma_max_zoomlevel(info):
+	if ("MaxZoomLevel" in info): 
+		try:
+			return int(info["MaxZoomLevel"])
+		except:
+			print("Something went wrong consulting the MaxZoomLevel key in info{} dictionary; value =", info["MaxZoomLevel"])
+			return 0
 	else:
-		for el in els:
-			l.append(el.firstChild.nodeValue)
-	return l
-	
+		try:
+			return int(info["NumberOfZoomLevels"])
+		except:
+			print("Something went wrong consulting the NumberOfZoomLevels key in info{} dictionary; value =", info["NumberOfZoomLevels"])
+			return 0
+
+def _pma_decode_image(content, output = "pil", out = None, draft = None):
+	# turn an encoded image into the representation asked for by the caller (see get_tile)
+	if (output == "bytes"):
+		return content
+	decoder = _pma_process_decoder
+	if (output == "numpy" and not (decoder is None)):
+		return decoder.decode(content, out, draft)
+	img = Image.open(BytesIO(content))
+	if not (draft is None):
+		# only has an effect on JPEG images: the decoder itself scales down by a factor of 2, 4 or 8
+		img.draft("RGB", tuple(draft))
+	return _pma_image_output(img, output, out)
+
+def _pma_image_output(img, output = "pil", out = None):
+	if (output == "pil"):
+		return img
+	elif (output == "numpy"):
+		_pma_require_numpy()
+		if (img.mode != "RGB"):
+			img = img.convert("RGB")
+		# a read-only view on the decoded bytes; no further copies unless the pixels have to go into out
+		pixels = np.frombuffer(img.tobytes(), dtype = np.uint8).reshape(img.height, img.width, 3)
+		if (out is None):
+			return pixels
+		if (out.shape[0] < img.height or out.shape[1] < img.width or out.shape[2:] != (3, )):
+			raise Exception("out array of shape " + str(out.shape) + " can't hold an image of " + str(img.width) + "x" + str(img.height))
+		view = out[:img.height, :img.width]
+		view[...] = pixels
+		return view
+	raise Exception("output should be 'pil', 'numpy' or 'bytes', not " + str(output))
+
+class _PmaProcessDecoder(object):
+	# Decodes encoded images on a pool of processes, to get JPEG decoding out from under the GIL.
+	# Pixels come back through a ring of slots in one shared memory block rather than as pickled arrays;
+	# a thread waiting for a decode holds on to its slot until it has copied the pixels out.
+	def __init__(self, processes, slot_bytes, slots):
+		self.processes = processes
+		self.slot_bytes = slot_bytes
+		# imported here rather than at the top: shared_memory needs Python 3.8, the rest of the module doesn't
+		from multiprocessing import shared_memory
+		self._memory = shared_memory.SharedMemory(create = True, size = slot_bytes * slots)
+		self._free = queue.Queue()
+		for slot in range(slots):
+			self._free.put(slot)
+		# spawn rather than fork: forking a process that is running download threads isn't safe
+		self._pool = ProcessPoolExecutor(max_workers = processes, mp_context = multiprocessing.get_context("spawn"))
+
+	def decode(self, content, out = None, draft = None):
+		slot = self._free.get()
+		try:
+			offset = slot * self.slot_bytes
+			(h, w) = self._pool.submit(_pma_decode_into_shared_memory, content, self._memory.name, offset, self.slot_bytes, draft).result()
+			pixels = np.ndarray((h, w, 3), dtype = np.uint8, buffer = self._memory.buf, offset = offset)
+			if (out is None):
+				return pixels.copy()
+			if (out.shape[0] < h or out.shape[1] < w or out.shape[2:] != (3, )):
+				raise Exception("out array of shape " + str(out.shape) + " can't hold an image of " + str(w) + "x" + str(h))
+			view = out[:h, :w]
+			view[...] = pixels
+			return view
+		finally:
+			self._free.put(slot)
+
+	def close(self):
+		self._pool.shutdown(wait = True)
+		self._memory.close()
+		self._memory.unlink()
+
+_pma_attached_memory = dict()		# in decoder processes: shared memory name => SharedMemory
+
+def _pma_decode_into_shared_memory(content, name, offset, size, draft = None):
+	# runs in a decoder process (see _PmaProcessDecoder); returns the (height, width) of the RGB pixels written at offset
+	if (not name in _pma_attached_memory):
+		from multiprocessing import shared_memory
+		_pma_attached_memory[name] = shared_memory.SharedMemory(name = name)
+	memory = _pma_attached_memory[name]
+	img = Image.open(BytesIO(content))
+	if not (draft is None):
+		img.draft("RGB", tuple(draft))
+	if (img.mode != "RGB"):
+		img = img.convert("RGB")
+	pixels = img.tobytes()
+	if (len(pixels) > size):
+		raise Exception("A decoded image of " + str(img.width) + "x" + str(img.height) + " doesn't fit the decoder's slots; raise max_image_size (see set_decode_processes)")
+	memory.buf[offset:offset + len(pixels)] = pixels
+	return (img.height, img.width)
+
+def _pma_require_numpy():
+	if (np is None):
+		raise ImportError("This function of pma_python requires numpy (pip install numpy)")
+
+def _pma_plane_key(channels, timeframe, layer):
+	# cache keys of tiles of the default plane stay as they were before planes could be selected
+	if ((channels, timeframe, layer) == (0, 0, 0)):
+		return ()
+	return (_pma_channels(channels), timeframe, layer)
+
+def _pma_channels(channels):
+	# PMA.core takes a comma-separated list of channels
+	if (isinstance(channels, (list, tuple, range))):
+		return ",".join(str(c) for c in channels)
+	return str(channels)
+
 def _pma_q(arg):
 	if (arg is None):
 		return ''
 	else:
 		return quote(str(arg), safe='')
 	
+def _pma_otsu_threshold(values):
+	# Otsu's method on 8-bit values: the threshold that maximizes the variance between the two classes it separates
+	histogram = np.bincount(values.ravel(), minlength = 256).astype(np.float64)
+	weights = np.cumsum(histogram)
+	means = np.cumsum(histogram * np.arange(256))
+	total, totalMean = weights[-1], means[-1]
+	with np.errstate(divide = "ignore", invalid = "ignore"):
+		between = (totalMean * weights - means * total) ** 2 / (weights * (total - weights))
+	return int(np.nanargmax(between)) if np.isfinite(between).any() else 0
+
+def _pma_mask_fraction(mask, width, height, x, y, w, h):
+	# fraction of the rectangle (x, y, w, h) of a level of width x height pixels that a whole-slide mask marks as tissue
+	(mh, mw) = mask.shape
+	x0, y0 = min(int(x * mw / width), mw - 1), min(int(y * mh / height), mh - 1)
+	x1, y1 = max(min(int(ceil((x + w) * mw / width)), mw), x0 + 1), max(min(int(ceil((y + h) * mh / height)), mh), y0 + 1)
+	return float(mask[y0:y1, x0:x1].mean())
+
+def _pma_tile_order(fromX, fromY, toX, toY, order = "column"):
+	# the (x, y) coordinates of the tiles within a rectangle, in the traversal order asked for (see get_tiles)
+	if (order == "column"):
+		return ((x, y) for x in range(fromX, toX) for y in range(fromY, toY))
+	if (order == "row"):
+		return ((x, y) for y in range(fromY, toY) for x in range(fromX, toX))
+	if not (order in ("morton", "hilbert")):
+		raise Exception("order should be 'column', 'row', 'morton' or 'hilbert', not " + str(order))
+	if (toX <= fromX or toY <= fromY):
+		return iter(())
+	# both curves are laid over the smallest power-of-two square that covers the rectangle; quadrants outside of it are skipped
+	size = 1
+	while (size < max(toX - fromX, toY - fromY)):
+		size *= 2
+	rect = (fromX, fromY, toX, toY)
+	if (order == "morton"):
+		return _pma_morton(fromX, fromY, size, rect)
+	return _pma_hilbert(fromX, fromY, size, 0, 0, size, rect)
+
+def _pma_morton(x, y, size, rect):
+	# Z-order: the top left, top right, bottom left and bottom right quadrants in turn, recursively
+	if (x >= rect[2] or y >= rect[3] or x + size <= rect[0] or y + size <= rect[1]):
+		return
+	if (size == 1):
+		yield (x, y)
+		return
+	half = size // 2
+	for (dx, dy) in ((0, 0), (half, 0), (0, half), (half, half)):
+		yield from _pma_morton(x + dx, y + dy, half, rect)
+
+def _pma_hilbert(x, y, ax, ay, bx, by, rect):
+	# Hilbert curve through the square spanned by the axis-aligned vectors a and b from corner (x, y);
+	# unlike Z-order every next tile is a neighbour of the previous one
+	(left, top) = (x + min(ax, 0) + min(bx, 0), y + min(ay, 0) + min(by, 0))
+	size = abs(ax + ay)
+	if (left >= rect[2] or top >= rect[3] or left + size <= rect[0] or top + size <= rect[1]):
+		return
+	if (size == 1):
+		yield (left, top)
+		return
+	(ax, ay, bx, by) = (ax // 2, ay // 2, bx // 2, by // 2)
+	yield from _pma_hilbert(x, y, bx, by, ax, ay, rect)
+	yield from _pma_hilbert(x + ax, y + ay, ax, ay, bx, by, rect)
+	yield from _pma_hilbert(x + ax + bx, y + ay + by, ax, ay, bx, by, rect)
+	yield from _pma_hilbert(x + ax + 2 * bx, y + ay + 2 * by, -bx, -by, -ax, -ay, rect)
+
 # end internal module helper variables and functions
 	
-def is_lite(pmacoreURL = _pma_pmacoreliteURL):
+def get_slide_file_extension(slideRef):
 	"""
-	See if there's a PMA.core.lite or PMA.core instance running at pmacoreURL
+	Determine the file extension for this slide
 	"""
-	return _pma_is_lite(pmacoreURL)
-	
-def get_version_info(pmacoreURL = _pma_pmacoreliteURL):
+	return os.path.splitext(slideRef)[-1]
+
+def get_slide_file_name(slideRef):
 	"""
-	Get version info from PMA.core instance running at pmacoreURL
+	Determine the file name (with extension) for this slide
 	"""
-	# purposefully DON'T use helper function _pma_api_url() here:
-	# why? because GetVersionInfo can be invoked WITHOUT a valid SessionID; _pma_api_url() takes session information into account
-	url = _pma_join(pmacoreURL, "api/xml/GetVersionInfo")
-	try:
-		contents = urlopen(url).read()
-	except Exception as e:
-		return None		
-	dom = minidom.parseString(contents)	
-	return (dom.firstChild.firstChild.nodeValue)
+	return os.path.basename(slideRef)
 
-def connect(pmacoreURL = _pma_pmacoreliteURL, pmacoreUsername = "", pmacorePassword = ""):
+def who_am_i():
 	"""
-	Attempt to connect to PMA.core instance; success results in a SessionID
+	Getting information about your Session (under construction)
 	"""
-	if (pmacoreURL == _pma_pmacoreliteURL):
-		if is_lite():
-			# no point authenticating localhost / PMA.core.lite
-			return _pma_pmacoreliteSessionID
-		else:
-			return None
-			
-	# purposefully DON'T use helper function _pma_api_url() here:	
-	# why? Because_pma_api_url() takes session information into account (which we don't have yet)
-	url = _pma_join(pmacoreURL, "api/xml/authenticate?caller=SDK.Python") 
-	if (pmacoreUsername != ""):
-		url += "&username=" + _pma_q(pmacoreUsername)
-	if (pmacorePassword != ""):
-		url += "&password=" + _pma_q(pmacorePassword)
-	
-	try:
-		contents = urlopen(url).read()
-		dom = minidom.parseString(contents)
-	except:
-		# Something went wrong; unable to communicate with specified endpoint
-		return None
-		
-	loginresult = dom.firstChild
-	succ = loginresult.getElementsByTagName("Success")[0]
-	
-	if (succ.firstChild.nodeValue.lower() == "false"):
-		sessionID = None
-	else:
-		sessionID = loginresult.getElementsByTagName("SessionId")[0]
-		sessionID = sessionID.firstChild.nodeValue
-		
-		global _pma_sessions
-		_pma_sessions[sessionID] = pmacoreURL
-		global _pma_slideinfos
-		_pma_slideinfos[sessionID] = dict()
-		global _pma_amount_of_data_downloaded
-		_pma_amount_of_data_downloaded[sessionID] = len(contents)
+	print ("Under construction")
+	return "Under construction"
 	
-	return (sessionID)	
+def _pma_level_paths(dest, zoomlevel):
+	# an exported level is an .npy array of pixels plus an .npy bitmap of the chunks that have been written so far
+	return (os.path.join(dest, "level_" + str(zoomlevel) + ".npy"), os.path.join(dest, "level_" + str(zoomlevel) + ".done.npy"))
 
-def disconnect(sessionID = None):
-	"""
-	Attempt to connect to PMA.core instance; success results in a SessionID
+def open_level(dest, zoomlevel, partial = False):
 	"""
-	sessionID = _pma_session_id(sessionID)
-	url = _pma_api_url(sessionID) + "DeAuthenticate?sessionID=" + _pma_q((sessionID))
-	contents = urlopen(url).read()
-	global _pma_amount_of_data_downloaded 
-	_pma_amount_of_data_downloaded[sessionID] += len(contents)
-	if (len(_pma_sessions.keys()) > 0):
-		# yes we do! This means that when there's a PMA.core active session AND PMA.core.lite version running, 
-		# the PMA.core active will be selected and returned
-		del _pma_sessions[sessionID]
-		del _pma_slideinfos[sessionID]
-	return True
-
-def get_root_directories(sessionID = None):
+	Open a level exported with export_level as a read-only (height, width, 3) numpy.memmap.
+	Reads are served straight from the operating system's page cache; nothing is decoded or copied up front.
+	Unless partial is True, an export that hasn't completed yet raises an exception
 	"""
-	Return an array of root-directories available to sessionID
-	"""
-	sessionID = _pma_session_id(sessionID)
-	url = _pma_api_url(sessionID) + "GetRootDirectories?sessionID=" + _pma_q((sessionID))
-	contents = urlopen(url).read()
-	global _pma_amount_of_data_downloaded 
-	_pma_amount_of_data_downloaded[sessionID] += len(contents)
-	dom = minidom.parseString(contents)
-	return _pma_XmlToStringArray(dom.firstChild)
-
-def get_directories(startDir, sessionID = None):
+	_pma_require_numpy()
+	(path, donePath) = _pma_level_paths(dest, zoomlevel)
+	if (not partial and not np.load(donePath).all()):
+		raise Exception("The export of zoomlevel " + str(zoomlevel) + " in " + dest + " is incomplete; resume it with export_level")
+	return np.load(path, mmap_mode = "r")
+
+def set_decode_processes(processes = None, max_image_size = (1024, 1024)):
 	"""
-	Return an array of sub-directories available to sessionID in the startDir directory
+	Decode images requested as numpy arrays (output = 'numpy' in get_tile and get_tiles, and get_region) on a pool of processes,
+	so that decoding scales with the number of cores instead of being limited by the GIL.
+	Downloads keep running on threads while earlier tiles are being decoded, so use workers > 1 in get_tiles and get_region.
+	processes defaults to the number of cores; pass 0 to go back to decoding in the calling thread.
+	max_image_size is the largest (width, height) that needs decoding this way (tiles, and thumbnails if you read those as arrays).
+	Tiles that were already decoded for the memory cache (see set_tile_memory_cache) aren't decoded again.
+	Needs Python 3.8 or later (multiprocessing.shared_memory)
 	"""
-	sessionID = _pma_session_id(sessionID)
-	url = _pma_api_url(sessionID, False) + "GetDirectories?sessionID=" + _pma_q(sessionID) + "&path=" + _pma_q(startDir)
-	r = requests.get(url)
-	json = r.json()
-	global _pma_amount_of_data_downloaded 
-	_pma_amount_of_data_downloaded[sessionID] += len(json)
-	if ("Code" in json):
-		raise Exception("get_directories to " + startDir + " resulted in: " + json["Message"] + " (keep in mind that startDir is case sensitive!)")
-	elif ("d" in json):
-		dirs  = json["d"]
-	else:
-		dirs = json
-	return dirs
+	_pma_require_numpy()
+	global _pma_process_decoder
+	with _pma_lock:
+		if not (_pma_process_decoder is None):
+			_pma_process_decoder.close()
+			_pma_process_decoder = None
+		if (processes is None):
+			processes = os.cpu_count() or 1
+		if (processes > 0):
+			_pma_process_decoder = _PmaProcessDecoder(processes, max_image_size[0] * max_image_size[1] * 3, 2 * processes)
 
-def get_first_non_empty_directory(startDir = None, sessionID = None):
-	sessionID = _pma_session_id(sessionID)
+def _pma_after_fork():
+	# runs in the child process right after os.fork() (and hence in fork-started multiprocessing workers)
+	global _pma_lock, _pma_process_decoder
+	_pma_lock = threading.RLock()
+	# the decoder's processes and shared memory belong to the parent; the child decodes in its own threads unless told otherwise
+	_pma_inherited.append(_pma_process_decoder)
+	_pma_process_decoder = None
+	for client in list(_pma_clients):
+		client._after_fork()
 
-	if ((startDir is None) or (startDir == "")):
-		startDir = "/"
-	slides = get_slides(startDir = startDir, sessionID = sessionID)
-	if (len(slides) > 0):
-		return startDir
-	else:
-		if (startDir == "/"):
-			for dir in get_root_directories(sessionID = sessionID):
-				nonEmtptyDir = get_first_non_empty_directory(startDir = dir, sessionID = sessionID)
-				if (not (nonEmtptyDir is None)):
-					return nonEmtptyDir
-		else:
-			for dir in get_directories(startDir, sessionID):
-				nonEmtptyDir = get_first_non_empty_directory(startDir = dir, sessionID = sessionID)
-				if (not (nonEmtptyDir is None)):
-					return nonEmtptyDir
-	return None
+if (hasattr(os, "register_at_fork")):
+	os.register_at_fork(after_in_child = _pma_after_fork)
 
-def get_slides(startDir, sessionID = None):
-	"""
-	Return an array of slides available to sessionID in the startDir directory
-	"""
-	sessionID = _pma_session_id(sessionID)
-	if (startDir.startswith("/")):
-		startDir = startDir[1:]		
-	url = _pma_api_url(sessionID, False) + "GetFiles?sessionID=" + _pma_q(sessionID) + "&path=" + _pma_q(startDir)	
-	r = requests.get(url)
-	json = r.json()
-	global _pma_amount_of_data_downloaded 
-	_pma_amount_of_data_downloaded[sessionID] += len(json)
-	if ("Code" in json):
-		raise Exception("get_slides from " + startDir + " resulted in: " + json["Message"] + " (keep in mind that startDir is case sensitive!)")
-	elif ("d" in json):
-		slides  = json["d"]
-	else:
-		slides = json
-	return slides
+@atexit.register
+def _pma_close_process_decoder():
+	# release the decoder's processes and shared memory, rather than leaving that to the resource tracker
+	global _pma_process_decoder
+	if not (_pma_process_decoder is None):
+		_pma_process_decoder.close()
+		_pma_process_decoder = None
 
-def get_slide_file_extension(slideRef):
+class SlideCatalog(object):
 	"""
-	Determine the file extension for this slide
+	Local (sqlite) index of the directories and slides found by walk_slides, per PMA.core instance.
+	Each slide is recorded with its directory and, when requested, its UID and slide information,
+	so that later runs only need to re-list directories whose listing has gone stale, and slides can be queried locally.
 	"""
-	return os.path.splitext(slideRef)[-1]
+	def __init__(self, path):
+		self.path = path
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+		with self._lock, self._db:
+			self._db.execute("PRAGMA journal_mode=WAL")
+			self._db.execute("CREATE TABLE IF NOT EXISTS directories (server TEXT, path TEXT, parent TEXT, listed REAL, PRIMARY KEY (server, path))")
+			self._db.execute("CREATE TABLE IF NOT EXISTS slides (server TEXT, path TEXT, directory TEXT, uid TEXT, info TEXT, PRIMARY KEY (server, path))")
+			self._db.execute("CREATE INDEX IF NOT EXISTS slides_directory ON slides (server, directory)")
 
-def get_slide_file_name(slideRef):
+	def close(self):
+		with self._lock:
+			self._db.close()
+
+	def get_listing(self, server, directory, max_age = None):
+		"""Return the (sub-directories, slides) recorded for directory, or None when it was never listed or the listing is older than max_age seconds"""
+		with self._lock:
+			row = self._db.execute("SELECT listed FROM directories WHERE server = ? AND path = ?", (server, directory)).fetchone()
+			if (row is None or row[0] is None or (not (max_age is None) and time.time() - row[0] > max_age)):
+				return None
+			dirs = [r[0] for r in self._db.execute("SELECT path FROM directories WHERE server = ? AND parent = ? ORDER BY path", (server, directory))]
+			slides = [r[0] for r in self._db.execute("SELECT path FROM slides WHERE server = ? AND directory = ? ORDER BY path", (server, directory))]
+		return (dirs, slides)
+
+	def set_listing(self, server, directory, dirs, slides):
+		"""Record a fresh listing of directory; sub-directories and slides that disappeared are dropped, along with their contents"""
+		with self._lock, self._db:
+			for (old, ) in self._db.execute("SELECT path FROM directories WHERE server = ? AND parent = ?", (server, directory)).fetchall():
+				if (not old in dirs):
+					# a prefix comparison rather than LIKE, in which _ and % in directory names would act as wildcards
+					self._db.execute("DELETE FROM directories WHERE server = ? AND (path = ? OR substr(path, 1, ?) = ?)", (server, old, len(old) + 1, old + "/"))
+					self._db.execute("DELETE FROM slides WHERE server = ? AND (directory = ? OR substr(directory, 1, ?) = ?)", (server, old, len(old) + 1, old + "/"))
+			self._db.execute("DELETE FROM slides WHERE server = ? AND directory = ? AND path NOT IN (" + ",".join("?" * len(slides)) + ")",
+				(server, directory) + tuple(slides))
+			self._db.executemany("INSERT OR IGNORE INTO directories (server, path, parent) VALUES (?, ?, ?)", [(server, d, directory) for d in dirs])
+			self._db.executemany("INSERT OR IGNORE INTO slides (server, path, directory) VALUES (?, ?, ?)", [(server, sl, directory) for sl in slides])
+			self._db.execute("INSERT OR REPLACE INTO directories (server, path, parent, listed) VALUES (?, ?, (SELECT parent FROM directories WHERE server = ? AND path = ?), ?)",
+				(server, directory, server, directory, time.time()))
+
+	def set_slide_details(self, server, slideRef, uid = None, info = None):
+		"""Record the UID and/or slide information of a slide"""
+		with self._lock, self._db:
+			if not (uid is None):
+				self._db.execute("UPDATE slides SET uid = ? WHERE server = ? AND path = ?", (uid, server, slideRef))
+			if not (info is None):
+				self._db.execute("UPDATE slides SET info = ? WHERE server = ? AND path = ?", (_pma_dumps(info), server, slideRef))
+
+	def get_slide(self, slideRef, server = None):
+		"""Return a dictionary with the path, directory, UID and slide information (if known) of a slide, or None if it isn't in the catalog"""
+		query = "SELECT server, path, directory, uid, info FROM slides WHERE path = ?"
+		args = (slideRef, )
+		if not (server is None):
+			query += " AND server = ?"
+			args += (server, )
+		with self._lock:
+			row = self._db.execute(query, args).fetchone()
+		if (row is None):
+			return None
+		return {"server": row[0], "path": row[1], "directory": row[2], "uid": row[3], "info": None if row[4] is None else _pma_loads(row[4])}
+
+	def get_slides(self, directory = None, recursive = True, pattern = None, server = None):
+		"""
+		Query the catalog for slides in directory (and below, when recursive), optionally matching a SQL LIKE pattern (e.g. "%.svs")
+		"""
+		query = "SELECT path FROM slides WHERE 1 = 1"
+		args = ()
+		if not (server is None):
+			query += " AND server = ?"
+			args += (server, )
+		if not (directory is None):
+			directory = directory.strip("/")
+			if (recursive):
+				query += " AND (directory = ? OR substr(directory, 1, ?) = ?)"
+				args += (directory, len(directory) + 1, directory + "/")
+			else:
+				query += " AND directory = ?"
+				args += (directory, )
+		if not (pattern is None):
+			query += " AND path LIKE ?"
+			args += (pattern, )
+		with self._lock:
+			return [r[0] for r in self._db.execute(query + " ORDER BY path", args)]
+
+class SlideGeometry(object):
 	"""
-	Determine the file name (with extension) for this slide
+	Immutable description of the pyramid of a slide, derived once from its slide information (see get_slide_geometry).
+	Per zoomlevel z (0 up to and including max_zoomlevel) it holds
+		widths[z], heights[z] = pixel dimensions,
+		xtiles[z], ytiles[z] = number of horizontal and vertical tiles,
+		mpp_x[z], mpp_y[z] = micrometres per pixel
 	"""
-	return os.path.basename(slideRef)
+	__slots__ = ("tile_size", "max_zoomlevel", "widths", "heights", "xtiles", "ytiles", "mpp_x", "mpp_y",
+		"number_of_timeframes", "number_of_layers", "number_of_channels")
+
+	def __init__(self, info):
+		maxZoomLevel = _pma_max_zoomlevel(info)
+		tileSize = int(info["TileSize"])
+		(width, height) = (int(info["Width"]), int(info["Height"]))
+		(mppX, mppY) = (float(info["MicrometresPerPixelX"]), float(info["MicrometresPerPixelY"]))
+		factors = [2 ** (maxZoomLevel - z) for z in range(0, maxZoomLevel + 1)]
+		widths = array("q", (int(ceil(width / f)) for f in factors))
+		heights = array("q", (int(ceil(height / f)) for f in factors))
+		timeframes = info.get("TimeFrames") or [{}]
+		layers = timeframes[0].get("Layers") or [{}]
+		init = object.__setattr__
+		init(self, "tile_size", (tileSize, tileSize))
+		init(self, "max_zoomlevel", maxZoomLevel)
+		init(self, "widths", widths)
+		init(self, "heights", heights)
+		init(self, "xtiles", array("q", (int(ceil(w / tileSize)) for w in widths)))
+		init(self, "ytiles", array("q", (int(ceil(h / tileSize)) for h in heights)))
+		init(self, "mpp_x", array("d", (mppX * f for f in factors)))
+		init(self, "mpp_y", array("d", (mppY * f for f in factors)))
+		init(self, "number_of_timeframes", len(timeframes))
+		init(self, "number_of_layers", len(layers))
+		init(self, "number_of_channels", max(len(layers[0].get("Channels") or []), 1))
 
-def get_uid(slideRef, sessionID = None):
+	def __setattr__(self, name, value):
+		raise AttributeError("SlideGeometry is immutable")
+
+	def __delattr__(self, name):
+		raise AttributeError("SlideGeometry is immutable")
+
+	def __repr__(self):
+		return "SlideGeometry(%dx%d, %d zoomlevels, tiles of %dx%d)" % (self.widths[-1], self.heights[-1], self.max_zoomlevel + 1, self.tile_size[0], self.tile_size[1])
+
+	def _level(self, zoomlevel):
+		return self.max_zoomlevel if zoomlevel is None else zoomlevel
+
+	def pixel_dimensions(self, zoomlevel = None):
+		"""(width, height) in pixels at zoomlevel (default: the maximum zoomlevel)"""
+		z = self._level(zoomlevel)
+		return (self.widths[z], self.heights[z])
+
+	def number_of_tiles(self, zoomlevel = None):
+		"""(x, y, n) number of horizontal, vertical and total tiles at zoomlevel (default: the maximum zoomlevel)"""
+		z = self._level(zoomlevel)
+		return (self.xtiles[z], self.ytiles[z], self.xtiles[z] * self.ytiles[z])
+
+	def microns_per_pixel(self, zoomlevel = None):
+		"""(x, y) micrometres per pixel at zoomlevel (default: the maximum zoomlevel)"""
+		z = self._level(zoomlevel)
+		return (self.mpp_x[z], self.mpp_y[z])
+
+	def zoomlevels_dict(self, min_number_of_tiles = 0):
+		"""{zoomlevel: (x, y, n)} for all zoomlevels with more than min_number_of_tiles tiles"""
+		return {z: self.number_of_tiles(z) for z in range(0, self.max_zoomlevel + 1) if self.xtiles[z] * self.ytiles[z] > min_number_of_tiles}
+
+class PMAClient(object):
 	"""
-	Get the UID for a specific slide 
+	A connection manager for one or more PMA.core (or PMA.core.lite) instances.
+	Each client owns its sessions, HTTP transport, caches, metrics and request hooks, so several clients can be used
+	side by side (e.g. one per server, or per application component) without sharing any state.
+	All methods are safe to call from multiple threads at once.
+	The module-level functions (connect, get_tile, ...) are bound to a default client; see get_default_client()
 	"""
-	sessionID = _pma_session_id(sessionID)
-	url = _pma_api_url(sessionID) + "GetUID?sessionID=" + _pma_q(sessionID) + "&path=" + _pma_q(slideRef)
-	contents = urlopen(url).read()
-	global _pma_amount_of_data_downloaded 
-	_pma_amount_of_data_downloaded[sessionID] += len(contents)
-	dom = minidom.parseString(contents)
-	return _pma_XmlToStringArray(dom)[0]
+	def __init__(self, **connection_options):
+		self._sessions = dict()				# sessionID => PMA.core URL
+		self._replicas = dict()				# sessionID => _PmaReplicaSet, for sessions made with connect_replicas()
+		self._slideinfos = dict()			# sessionID => _PmaSlideInfoCache
+		self._slideinfo_max_entries = 10000
+		self._slideinfo_ttl = None			# seconds; None means slide information never expires
+		self._slideinfo_store = None		# optional persistent _PmaSlideInfoStore shared by all sessions
+		self._lite = dict()					# URL => (result of the last IsLite probe, time of the probe)
+		self._lite_ttl = 30					# seconds before a cached IsLite probe is repeated
+		self._http_sessions = dict()
+		self._http_pool_size = 16
+		self._http_timeout = (5, 60)		# (connect, read) timeouts in seconds
+		self._http_retries = 3
+		self._http_backoff_factor = 0.25
+		self._tile_disk_cache = None		# see set_tile_disk_cache()
+		self._tile_memory_cache = None		# see set_tile_memory_cache()
+		self._tissue_masks = _PmaMemoryCache(64 * 1024 ** 2)	# see get_tissue_mask()
+		self._slide_uids = dict()			# (sessionID, slideRef) => UID, as used in the keys of the tile disk cache
+		self._aio_sessions = weakref.WeakKeyDictionary()	# event loop => {sessionID: (aiohttp.ClientSession, asyncio.Semaphore)}
+		self._aio_concurrency = 64
+		self._metrics = dict()				# (sessionID, endpoint) => _PmaEndpointMetrics
+		self._request_hooks = {"before": [], "after": []}
+		self._flights = _PmaSingleFlight()	# identical requests in flight, see _coalesce()
+		self._aio_flights = weakref.WeakKeyDictionary()	# event loop => {key: asyncio.Task}
+		self._hedging = None				# (percentile, min_seconds, min_requests), see set_tile_hedging()
+		self._hedge_executor = None
+		self._lock = threading.RLock()
+		self.set_connection_options(**connection_options)
+		_pma_clients.add(self)
+
+	def __repr__(self):
+		return "PMAClient(" + ", ".join(sorted(str(url) for url in self._sessions.values())) + ")"
+
+	def __reduce__(self):
+		# the module-level functions are bound methods of the default client; pickling one (e.g. to hand it to a process pool)
+		# pickles the client, which is restored as the default client of the receiving process rather than copied with its locks
+		if (self is _pma_client):
+			return (get_default_client, ())
+		raise TypeError("Only the default PMAClient can be pickled; use get_worker_state to hand the state of other clients to a worker")
+
+	def close(self):
+		"""Close all connections of this client; its sessions stay valid and reconnect on their next use"""
+		with self._lock:
+			sessionIDs = list(self._http_sessions.keys())
+		for sessionID in sessionIDs:
+			self._http_close(sessionID)
+		with self._lock:
+			(executor, self._hedge_executor) = (self._hedge_executor, None)
+		if not (executor is None):
+			executor.shutdown(wait = False)
+
+	def _after_fork(self):
+		# In a forked child, locks may be held by threads that only exist in the parent, and connections, thread pools and
+		# sqlite handles are shared with it. Start over with fresh ones, keeping sessions, settings and cached data.
+		# Inherited connections and sqlite handles are set aside rather than closed, as closing them could disturb the parent's
+		self._lock = threading.RLock()
+		_pma_inherited.append((self._http_sessions, self._slideinfo_store))
+		self._http_sessions = dict()
+		self._aio_sessions = weakref.WeakKeyDictionary()
+		self._aio_flights = weakref.WeakKeyDictionary()
+		self._flights = _PmaSingleFlight()
+		self._hedge_executor = None if self._hedging is None else ThreadPoolExecutor(max_workers = 4 * self._http_pool_size)
+		for cache in [self._tile_disk_cache, self._tile_memory_cache, self._tissue_masks] + list(self._slideinfos.values()):
+			if not (cache is None):
+				cache._lock = threading.Lock()
+		for replicas in self._replicas.values():
+			replicas._lock = threading.Lock()
+			for replica in replicas.replicas:
+				(replica.outstanding, replica.probing) = (0, False)
+		if not (self._slideinfo_store is None):
+			self._slideinfo_store = _PmaSlideInfoStore(self._slideinfo_store.path)
+
+	def _session_id(self, sessionID = None):
+		if (sessionID is None):
+			# if the sessionID isn't specified, maybe we can still recover it somehow
+			return self._first_session_id()
+		else:
+			# nothing to do in this case; a SessionID WAS passed along, so just continue using it
+			return sessionID
+		
+	def _first_session_id(self):
+		# do we have any stored sessions from earlier login events?
+		with self._lock:
+			sessionID = next(iter(self._sessions), None)
+		if not (sessionID is None):
+			# yes we do! This means that when there's a PMA.core active session AND PMA.core.lite version running, 
+			# the PMA.core active will be selected and returned
+			return sessionID
+		else:
+			# ok, we don't have stored sessions; not a problem per se...
+			if (self._is_lite(cached = True)):
+				return _pma_pmacoreliteSessionID
+			else:
+				# no stored PMA.core sessions found NOR PMA.core.lite
+				return None
+
+	def _slideinfo_cache(self, sessionID):
+		cache = self._slideinfos.get(sessionID)
+		if (cache is None):
+			# e.g. PMA.core.lite, which is used without connecting first
+			with self._lock:
+				cache = self._slideinfos.setdefault(sessionID, _PmaSlideInfoCache(self._slideinfo_max_entries, self._slideinfo_ttl))
+		return cache
 	
-def who_am_i():
-	"""
-	Getting information about your Session (under construction)
-	"""
-	print ("Under construction")
-	return "Under construction"
+	def _url(self, sessionID = None):	
+		sessionID = self._session_id(sessionID)
+		if sessionID is None:
+			# sort of a hopeless situation; there is no URL to refer to
+			return None
+		elif sessionID == _pma_pmacoreliteSessionID:
+			return _pma_pmacoreliteURL
+		else:
+			# assume sessionID is a valid session; otherwise the following will generate an error
+			url = self._sessions.get(sessionID)
+			if not (url is None):
+				if (not url.endswith("/")):
+					url = url + "/"
+				return url
+			else:
+				raise Exception("Invalid sessionID:", sessionID)
+
+	def _is_lite(self, pmacoreURL = _pma_pmacoreliteURL, cached = False):
+		# with cached = True, a probe from less than _lite_ttl seconds ago is reused rather than asking the server again
+		if (cached):
+			(result, probed) = self._lite.get(pmacoreURL, (None, None))
+			if not (probed is None) and time.time() - probed < self._lite_ttl:
+				return result
+		url = _pma_join(pmacoreURL, "api/json/IsLite")
+		try:
+			json = self._http_get(url).json()
+			result = str(_pma_json_result(json)).lower() == "true"
+		except Exception as e:
+			# this happens when NO instance of PMA.core is detected
+			result = None
+		self._lite[pmacoreURL] = (result, time.time())
+		return result
+
+	def _http_session(self, sessionID = None):
+		# one pooled, keep-alive transport per session; calls made without a session (is_lite, connect, ...) share the None entry
+		with self._lock:
+			if (not sessionID in self._http_sessions):
+				if (sessionID is None):
+					# don't retry session-less probes: a missing PMA.core.lite instance should be reported right away
+					retry = Retry(total = 0, raise_on_status = False)
+				else:
+					retry = Retry(total = self._http_retries, backoff_factor = self._http_backoff_factor,
+						status_forcelist = (502, 503, 504), allowed_methods = frozenset(["GET"]), raise_on_status = False)
+				adapter = HTTPAdapter(pool_connections = 4, pool_maxsize = self._http_pool_size, max_retries = retry)
+				s = requests.Session()
+				s.mount("http://", adapter)
+				s.mount("https://", adapter)
+				self._http_sessions[sessionID] = s
+			return self._http_sessions[sessionID]
+
+	def _http_close(self, sessionID = None):
+		with self._lock:
+			s = self._http_sessions.pop(sessionID, None)
+		if not (s is None):
+			s.close()
+
+	def _http_get(self, url, sessionID = None):
+		# all traffic to PMA.core goes through here, so connections get reused and data accounting happens in one place
+		replicas = None if sessionID is None else self._replicas.get(sessionID)
+		if (replicas is None):
+			return self._http_request(url, sessionID, sessionID)
+		self._check_replicas(replicas)
+		tried = set()
+		(response, error) = (None, None)
+		while True:
+			replica = replicas.acquire(tried)
+			if (replica is None):
+				# every node with a session has failed this request; report how the last one did
+				if not (error is None):
+					raise error
+				return response
+			tried.add(replica)
+			start = time.perf_counter()
+			try:
+				r = self._http_request(replicas.rewrite(url, replica), sessionID, replica.sessionID)
+			except Exception as e:
+				replicas.release(replica, time.perf_counter() - start, False)
+				(response, error) = (None, e)
+				continue
+			failed = _pma_replica_failed(r.status_code)
+			replicas.release(replica, time.perf_counter() - start, not failed)
+			if (not failed):
+				return r
+			(response, error) = (r, None)
+
+	def _http_request(self, url, sessionID, transport):
+		# a single request over the transport of sessionID, or of one of its replicas
+		endpoint = _pma_endpoint(url)
+		self._before_request(sessionID, endpoint, url)
+		start = time.perf_counter()
+		try:
+			r = self._http_session(transport).get(url, timeout = self._http_timeout)
+		except Exception as e:
+			self._after_request(sessionID, endpoint, url, None, 0, time.perf_counter() - start, 0, e)
+			raise
+		# urllib3 keeps track of the retries it needed to get this response
+		retries = getattr(r.raw, "retries", None)
+		retries = 0 if retries is None else len(retries.history)
+		self._after_request(sessionID, endpoint, url, r.status_code, _pma_wire_bytes(r.headers, r.content, r.raw), time.perf_counter() - start, retries, None)
+		return r
+
+	def _before_request(self, sessionID, endpoint, url):
+		for hook in list(self._request_hooks["before"]):
+			hook(sessionID, endpoint, url)
+
+	def _after_request(self, sessionID, endpoint, url, status, nbytes, seconds, retries, error):
+		with self._lock:
+			key = (sessionID, endpoint)
+			if (not key in self._metrics):
+				self._metrics[key] = _PmaEndpointMetrics()
+			self._metrics[key].record(status, nbytes, seconds, retries, error)
+		for hook in list(self._request_hooks["after"]):
+			hook(sessionID, endpoint, url, status, nbytes, seconds, error)
+
+	def _record_cache_hit(self, sessionID, endpoint, kind):
+		with self._lock:
+			key = (sessionID, endpoint)
+			if (not key in self._metrics):
+				self._metrics[key] = _PmaEndpointMetrics()
+			hits = self._metrics[key].cache_hits
+			hits[kind] = hits.get(kind, 0) + 1
+
+	def _record_event(self, sessionID, endpoint, counter):
+		# counter is "coalesced" or "hedged"
+		with self._lock:
+			key = (sessionID, endpoint)
+			if (not key in self._metrics):
+				self._metrics[key] = _PmaEndpointMetrics()
+			setattr(self._metrics[key], counter, getattr(self._metrics[key], counter) + 1)
+
+	def _coalesce(self, key, sessionID, endpoint, func):
+		# identical requests from several threads at once go out only once; they all get the same result
+		(result, shared) = self._flights.do(key, func)
+		if (shared):
+			self._record_event(sessionID, endpoint, "coalesced")
+		return result
+
+	async def _aio_coalesce(self, key, sessionID, endpoint, coroutine_func):
+		# asyncio counterpart of _coalesce, for coroutines running on the same event loop
+		with self._lock:
+			flights = self._aio_flights.setdefault(asyncio.get_running_loop(), dict())
+		task = flights.get(key)
+		if (task is None):
+			task = flights[key] = asyncio.ensure_future(coroutine_func())
+			task.add_done_callback(lambda t: flights.pop(key, None))
+		else:
+			self._record_event(sessionID, endpoint, "coalesced")
+		# a caller that is cancelled mustn't cancel the request the others are waiting for
+		return await asyncio.shield(task)
+
+	def _hedge_delay(self, sessionID):
+		# how long a tile request may take before it's duplicated; None while hedging is off or there's too little history
+		hedging = self._hedging
+		if (hedging is None):
+			return None
+		(percentile, min_seconds, min_requests) = hedging
+		with self._lock:
+			metrics = self._metrics.get((sessionID, "tile"))
+			if (metrics is None or metrics.requests < min_requests):
+				return None
+			return max(metrics.percentile(percentile), min_seconds)
+
+	def _hedged_get(self, url, sessionID):
+		delay = self._hedge_delay(sessionID)
+		executor = self._hedge_executor
+		if (delay is None or executor is None):
+			return self._http_get(url, sessionID)
+		first = executor.submit(self._http_get, url, sessionID)
+		if (len(wait([first], timeout = delay)[0]) > 0):
+			return first.result()
+		# the request is slower than most: race a duplicate against it (with replicas, it goes to another node)
+		self._record_event(sessionID, "tile", "hedged")
+		pending = [first, executor.submit(self._http_get, url, sessionID)]
+		while True:
+			done = wait(pending, return_when = FIRST_COMPLETED)[0]
+			for future in done:
+				pending.remove(future)
+				if (len(pending) == 0 or (future.exception() is None and future.result().status_code == 200)):
+					return future.result()
+
+	async def _aio_hedged_get(self, url, sessionID):
+		# returns (body, HTTP status), like _aio_fetch
+		delay = self._hedge_delay(sessionID)
+		if (delay is None):
+			return await self._aio_fetch(url, sessionID)
+		first = asyncio.ensure_future(self._aio_fetch(url, sessionID))
+		if (len((await asyncio.wait([first], timeout = delay))[0]) > 0):
+			return first.result()
+		self._record_event(sessionID, "tile", "hedged")
+		pending = {first, asyncio.ensure_future(self._aio_fetch(url, sessionID))}
+		try:
+			while True:
+				(done, pending) = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+				for task in done:
+					if (len(pending) == 0 or (task.exception() is None and task.result()[1] == 200)):
+						return task.result()
+		finally:
+			for task in pending:
+				task.cancel()
+
+	def _api_url(self, sessionID = None, xml = True):
+		# let's get the base URL first for the specified session
+		url = self._url(sessionID)
+		if url is None:
+			# sort of a hopeless situation; there is no URL to refer to
+			return None
+		# remember, _url is guaranteed to return a URL that ends with "/"
+		if (xml == True):
+			return _pma_join(url, "api/xml/")
+		else:
+			return _pma_join(url, "api/json/")
 	
-def sessions():
-	global _pma_sessions
-	return _pma_sessions
-
-def get_tile_size(sessionID = None):
-	sessionID = _pma_session_id(sessionID)
-	global _pma_slideinfos
-	if (len(_pma_slideinfos[sessionID]) < 1):
-		dir = get_first_non_empty_directory(sessionID)
-		slides = get_slides(dir, sessionID)
-		info = get_slide_info(sessionID, slides[0])
-	else:
-		info = choice(list(_pma_slideinfos[sessionID].values()))
-		
-	return (int(info["TileSize"]), int(info["TileSize"]))
+	def _aio_session(self, sessionID = None):
+		# aiohttp sessions are bound to the event loop that created them, so keep one per (loop, sessionID)
+		if (aiohttp is None):
+			raise ImportError("The asyncio API of pma_python requires aiohttp (pip install aiohttp)")
+		loop = asyncio.get_running_loop()
+		with self._lock:
+			sessions = self._aio_sessions.setdefault(loop, dict())
+			if (not sessionID in sessions or sessions[sessionID][0].closed):
+				if (isinstance(self._http_timeout, tuple)):
+					timeout = aiohttp.ClientTimeout(sock_connect = self._http_timeout[0], sock_read = self._http_timeout[1])
+				else:
+					timeout = aiohttp.ClientTimeout(sock_connect = self._http_timeout, sock_read = self._http_timeout)
+				connector = aiohttp.TCPConnector(limit = self._aio_concurrency)
+				sessions[sessionID] = (aiohttp.ClientSession(connector = connector, timeout = timeout), asyncio.Semaphore(self._aio_concurrency))
+			return sessions[sessionID]
+
+	async def _aio_get(self, url, sessionID = None):
+		# asyncio counterpart of _http_get: returns the raw response body, retrying the same failures with the same backoff
+		return (await self._aio_fetch(url, sessionID))[0]
+
+	async def _aio_fetch(self, url, sessionID = None):
+		# _aio_get, returning (body, HTTP status)
+		replicas = None if sessionID is None else self._replicas.get(sessionID)
+		if (replicas is None):
+			return await self._aio_request(url, sessionID, sessionID)
+		if (replicas.any_due()):
+			# health checks are blocking, so they run on the default executor rather than in the event loop
+			await asyncio.get_running_loop().run_in_executor(None, self._check_replicas, replicas)
+		tried = set()
+		(response, error) = (None, None)
+		while True:
+			replica = replicas.acquire(tried)
+			if (replica is None):
+				# every node with a session has failed this request; report how the last one did
+				if not (error is None):
+					raise error
+				return response
+			tried.add(replica)
+			start = time.perf_counter()
+			try:
+				(content, status) = await self._aio_request(replicas.rewrite(url, replica), sessionID, replica.sessionID)
+			except Exception as e:
+				replicas.release(replica, time.perf_counter() - start, False)
+				(response, error) = (None, e)
+				continue
+			failed = _pma_replica_failed(status)
+			replicas.release(replica, time.perf_counter() - start, not failed)
+			if (not failed):
+				return (content, status)
+			(response, error) = ((content, status), None)
+
+	async def _aio_request(self, url, sessionID, transport):
+		session, semaphore = self._aio_session(transport)
+		endpoint = _pma_endpoint(url)
+		self._before_request(sessionID, endpoint, url)
+		start = time.perf_counter()
+		retries = 0 if sessionID is None else self._http_retries
+		for attempt in range(retries + 1):
+			try:
+				async with semaphore:
+					async with session.get(url) as r:
+						content = await r.read()
+						status = r.status
+						nbytes = _pma_wire_bytes(r.headers, content)
+			except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+				if (attempt == retries):
+					self._after_request(sessionID, endpoint, url, None, 0, time.perf_counter() - start, attempt, e)
+					raise
+			else:
+				if (status not in (502, 503, 504) or attempt == retries):
+					break
+			await asyncio.sleep(self._http_backoff_factor * (2 ** attempt))
+		self._after_request(sessionID, endpoint, url, status, nbytes, time.perf_counter() - start, attempt, None)
+		return (content, status)
+
+	def _check_replicas(self, replicas):
+		# bring ejected nodes back once they answer again; nodes may have restarted, so they get a fresh session
+		for replica in replicas.due_for_check():
+			sessionID = None
+			if not (self._is_lite(replica.url) is None):
+				sessionID = self._authenticate(replica.url, replicas.username, replicas.password)
+			replicas.checked(replica, sessionID)
+
+	def _stored_slide_info(self, slideRef, sessionID):
+		store = self._slideinfo_store
+		if (store is None):
+			return None
+		info = store.get(self._url(sessionID), slideRef, self._slideinfo_ttl)
+		if not (info is None):
+			self._record_cache_hit(sessionID, "GetImageInfo", "disk")
+		return info
+
+	def _store_slide_info(self, slideRef, sessionID, info):
+		store = self._slideinfo_store
+		if (store is None):
+			return
+		uid = info.get("UID")
+		if (not uid):
+			# older PMA.core versions don't report the UID as part of the slide information
+			uid = self._slide_uid(slideRef, sessionID)
+		store.put(self._url(sessionID), slideRef, uid, info)
+
+	def _slide_uid(self, slideRef, sessionID):
+		# UIDs don't change for the lifetime of a slide, so one GetUID call per slide is enough
+		key = (sessionID, slideRef)
+		if (not key in self._slide_uids):
+			self._slide_uids[key] = self.get_uid(slideRef, sessionID)
+		return self._slide_uids[key]
+
+	def _get_image_content(self, url, slideRef, sessionID, key, hedge = False):
+		# fetch an encoded image, going through the client-side disk cache (if any) first
+		return self._coalesce(url, sessionID, _pma_endpoint(url), lambda: self._load_image_content(url, slideRef, sessionID, key, hedge))
+
+	def _load_image_content(self, url, slideRef, sessionID, key, hedge):
+		get = self._hedged_get if hedge else self._http_get
+		cache = self._tile_disk_cache
+		if (cache is None):
+			r = get(url, sessionID)
+			_pma_check_image_status(url, slideRef, r.status_code)
+			return r.content
+		if (slideRef.startswith("/")):
+			slideRef = slideRef[1:]
+		key = (self._url(sessionID), self._slide_uid(slideRef, sessionID)) + key
+		content = cache.get(key)
+		if not (content is None):
+			self._record_cache_hit(sessionID, _pma_endpoint(url), "disk")
+		else:
+			r = get(url, sessionID)
+			_pma_check_image_status(url, slideRef, r.status_code)
+			content = r.content
+			cache.put(key, content)
+		return content
+
+	def is_lite(self, pmacoreURL = _pma_pmacoreliteURL):
+		"""
+		See if there's a PMA.core.lite or PMA.core instance running at pmacoreURL
+		"""
+		return self._is_lite(pmacoreURL)
 	
-def get_slide_info(slideRef, sessionID = None):
-	"""
-	Return raw image information in the form of nested dictionaries
-	"""
-	sessionID = _pma_session_id(sessionID)
-	if (slideRef.startswith("/")):
-		slideRef = slideRef[1:]
+	def get_version_info(self, pmacoreURL = _pma_pmacoreliteURL):
+		"""
+		Get version info from PMA.core instance running at pmacoreURL
+		"""
+		# purposefully DON'T use helper function self._api_url() here:
+		# why? because GetVersionInfo can be invoked WITHOUT a valid SessionID; self._api_url() takes session information into account
+		url = _pma_join(pmacoreURL, "api/json/GetVersionInfo")
+		try:
+			json = self._http_get(url).json()
+		except Exception as e:
+			return None		
+		return _pma_json_result(json)
+
+	def set_connection_options(self, pool_size = None, timeout = None, retries = None, backoff_factor = None, async_concurrency = None):
+		"""
+		Configure the pooled HTTP transport used to talk to PMA.core
+		pool_size is the number of keep-alive connections kept per session (raise it when fetching tiles from many threads)
+		timeout is either a number of seconds or a (connect, read) tuple
+		retries and backoff_factor control how failed (connection errors, HTTP 502/503/504) GET requests are retried
+		async_concurrency is the maximum number of requests in flight per session for the asyncio API (aget_tile etc.);
+		it applies to connections opened after the call
+		"""
+		with self._lock:
+			if not (async_concurrency is None):
+				self._aio_concurrency = async_concurrency
+			if not (pool_size is None):
+				self._http_pool_size = pool_size
+			if not (timeout is None):
+				self._http_timeout = timeout
+			if not (retries is None):
+				self._http_retries = retries
+			if not (backoff_factor is None):
+				self._http_backoff_factor = backoff_factor
+			# existing transports are rebuilt with the new settings on their next use
+			for sessionID in list(self._http_sessions.keys()):
+				self._http_close(sessionID)
+
+	def connect(self, pmacoreURL = _pma_pmacoreliteURL, pmacoreUsername = "", pmacorePassword = ""):
+		"""
+		Attempt to connect to PMA.core instance; success results in a SessionID
+		"""
+		if (pmacoreURL == _pma_pmacoreliteURL):
+			if self.is_lite():
+				# no point authenticating localhost / PMA.core.lite
+				return _pma_pmacoreliteSessionID
+			else:
+				return None
+			
+		sessionID = self._authenticate(pmacoreURL, pmacoreUsername, pmacorePassword)
+		if not (sessionID is None):
+			with self._lock:
+				self._sessions[sessionID] = pmacoreURL
+				self._slideinfos[sessionID] = _PmaSlideInfoCache(self._slideinfo_max_entries, self._slideinfo_ttl)
+	
+		return (sessionID)	
+
+	def _authenticate(self, pmacoreURL, pmacoreUsername, pmacorePassword):
+		# returns the sessionID, or None when authentication failed
+		# purposefully DON'T use helper function self._api_url() here:	
+		# why? Because self._api_url() takes session information into account (which we don't have yet)
+		url = _pma_join(pmacoreURL, "api/json/authenticate?caller=SDK.Python") 
+		if (pmacoreUsername != ""):
+			url += "&username=" + _pma_q(pmacoreUsername)
+		if (pmacorePassword != ""):
+			url += "&password=" + _pma_q(pmacorePassword)
+	
+		try:
+			r = self._http_get(url)
+			loginresult = _pma_json_result(r.json())
+		except:
+			# Something went wrong; unable to communicate with specified endpoint
+			return None
 		
-	global _pma_slideinfos
-
-	if (not (slideRef in _pma_slideinfos[sessionID])):
-		url = _pma_api_url(sessionID, False) + "GetImageInfo?SessionID=" + _pma_q(sessionID) +  "&pathOrUid=" + _pma_q(slideRef)
-		print(url);
-		r = requests.get(url)
-		json = r.json()
-		global _pma_amount_of_data_downloaded 
-		_pma_amount_of_data_downloaded[sessionID] += len(json)
+		if (str(loginresult.get("Success")).lower() != "true"):
+			return None
+		return loginresult["SessionId"]
+
+	def connect_replicas(self, pmacoreURLs, pmacoreUsername = "", pmacorePassword = "", max_errors = 3, eject_seconds = 10):
+		"""
+		Connect to several PMA.core nodes that serve the same slides (e.g. replicas behind shared storage) as one logical session.
+		Every node gets its own session; requests made with the returned sessionID are sent to the healthy node with the
+		fewest requests in flight (weighted by its recent latency), and retried on another node when one fails.
+		A node that fails max_errors requests in a row is taken out of rotation; after eject_seconds it's checked with IsLite
+		and, when it answers, re-authenticated and put back. Nodes that can't be reached right away are treated the same way.
+		Returns None when none of the nodes accepts the credentials
+		"""
+		replicas = [_PmaReplica(url, self._authenticate(url, pmacoreUsername, pmacorePassword)) for url in pmacoreURLs]
+		available = [r for r in replicas if not (r.sessionID is None)]
+		if (len(available) == 0):
+			return None
+		# requests are built against the first available node; _PmaReplicaSet.rewrite points them at the node that is picked
+		replicas.remove(available[0])
+		replicas.insert(0, available[0])
+		sessionID = available[0].sessionID
+		replicaSet = _PmaReplicaSet(sessionID, replicas, pmacoreUsername, pmacorePassword, max_errors, eject_seconds)
+		for r in replicas:
+			if (r.sessionID is None):
+				r.ejected_until = time.time() + eject_seconds
+		with self._lock:
+			self._sessions[sessionID] = replicas[0].url
+			self._replicas[sessionID] = replicaSet
+			self._slideinfos[sessionID] = _PmaSlideInfoCache(self._slideinfo_max_entries, self._slideinfo_ttl)
+		return sessionID
+
+	def get_replica_status(self, sessionID = None):
+		"""
+		For a session made with connect_replicas, list the nodes with their URL, sessionID, health, requests in flight,
+		average latency (seconds) and number of requests and errors; None for other sessions
+		"""
+		replicas = self._replicas.get(self._session_id(sessionID))
+		return None if replicas is None else replicas.status()
+
+	def disconnect(self, sessionID = None):
+		"""
+		Attempt to connect to PMA.core instance; success results in a SessionID
+		"""
+		sessionID = self._session_id(sessionID)
+		replicas = self._replicas.get(sessionID)
+		if (replicas is None):
+			url = self._api_url(sessionID, False) + "DeAuthenticate?sessionID=" + _pma_q((sessionID))
+			self._http_get(url, sessionID)
+		else:
+			# every node has a session of its own to end
+			for replica in replicas.replicas:
+				if not (replica.sessionID is None):
+					try:
+						self._http_request(replica.url + "api/json/DeAuthenticate?sessionID=" + _pma_q(replica.sessionID), sessionID, replica.sessionID)
+					except Exception:
+						pass		# an unreachable node can't end its session anyway
+					self._http_close(replica.sessionID)
+		with self._lock:
+			self._sessions.pop(sessionID, None)
+			self._slideinfos.pop(sessionID, None)
+			self._replicas.pop(sessionID, None)
+		self._http_close(sessionID)
+		return True
+
+	def get_worker_state(self, slide_info = True):
+		"""
+		Capture what a worker process needs to carry on where this client is: its sessions (replica sets included),
+		connection options, cache settings and, with slide_info = True, the slide information and UIDs cached in memory.
+		Hand it to init_worker in every worker, e.g.
+			ProcessPoolExecutor(initializer = pma.init_worker, initargs = (pma.get_worker_state(), ))
+		so workers reuse the sessions instead of authenticating again. Workers share slide information through the
+		sqlite store (see set_slide_info_cache) and downloaded tiles through the disk cache (see set_tile_disk_cache),
+		if those are in use; put the disk cache on a RAM disk such as /dev/shm to share tiles through memory.
+		Fork-started workers inherit all of this anyway, but spawn-started ones (the default on Windows and macOS) start empty.
+		The state is a picklable dict; note that it holds the credentials of replica sets, which are needed to re-authenticate nodes
+		"""
+		with self._lock:
+			state = {"sessions": dict(self._sessions),
+				"replicas": {sessionID: {"nodes": [(r.url, r.sessionID) for r in replicas.replicas], "username": replicas.username,
+					"password": replicas.password, "max_errors": replicas.max_errors, "eject_seconds": replicas.eject_seconds}
+					for (sessionID, replicas) in self._replicas.items()},
+				"connection_options": {"pool_size": self._http_pool_size, "timeout": self._http_timeout, "retries": self._http_retries,
+					"backoff_factor": self._http_backoff_factor, "async_concurrency": self._aio_concurrency},
+				"slide_info_cache": {"max_entries": self._slideinfo_max_entries, "ttl": self._slideinfo_ttl,
+					"path": None if self._slideinfo_store is None else self._slideinfo_store.path},
+				"tile_disk_cache": None if self._tile_disk_cache is None else (self._tile_disk_cache.directory, self._tile_disk_cache.max_bytes),
+				"tile_memory_cache": None if self._tile_memory_cache is None else self._tile_memory_cache.max_bytes,
+				"tile_hedging": self._hedging,
+				"slide_info": dict(),
+				"slide_uids": dict(self._slide_uids) if slide_info else dict()}
+			caches = list(self._slideinfos.items()) if slide_info else []
+		for (sessionID, cache) in caches:
+			state["slide_info"][sessionID] = cache.items()
+		return state
+
+	def init_worker(self, state):
+		"""
+		Set up this client (in a worker process) from the state captured by get_worker_state in the parent process
+		"""
+		self.set_connection_options(**state["connection_options"])
+		self.set_slide_info_cache(**state["slide_info_cache"])
+		if not (state["tile_disk_cache"] is None):
+			self.set_tile_disk_cache(*state["tile_disk_cache"])
+		self.set_tile_memory_cache(state["tile_memory_cache"])
+		if not (state["tile_hedging"] is None):
+			self.set_tile_hedging(*state["tile_hedging"])
+		with self._lock:
+			for (sessionID, url) in state["sessions"].items():
+				self._sessions[sessionID] = url
+				self._slideinfos.setdefault(sessionID, _PmaSlideInfoCache(self._slideinfo_max_entries, self._slideinfo_ttl))
+			for (sessionID, r) in state["replicas"].items():
+				replicas = [_PmaReplica(url, replicaSessionID) for (url, replicaSessionID) in r["nodes"]]
+				self._replicas[sessionID] = _PmaReplicaSet(sessionID, replicas, r["username"], r["password"], r["max_errors"], r["eject_seconds"])
+				for replica in replicas:
+					if (replica.sessionID is None):
+						replica.ejected_until = time.time()		# due for a health check right away
+			self._slide_uids.update(state["slide_uids"])
+		for (sessionID, items) in state["slide_info"].items():
+			cache = self._slideinfo_cache(sessionID)
+			for (slideRef, info) in items:
+				cache.put(slideRef, info)
+
+	def get_root_directories(self, sessionID = None):
+		"""
+		Return an array of root-directories available to sessionID
+		"""
+		sessionID = self._session_id(sessionID)
+		url = self._api_url(sessionID, False) + "GetRootDirectories?sessionID=" + _pma_q((sessionID))
+		json = self._http_get(url, sessionID).json()
+		if ("Code" in json):
+			raise Exception("get_root_directories resulted in: " + json["Message"])
+		return _pma_json_result(json)
+
+	def get_directories(self, startDir, sessionID = None):
+		"""
+		Return an array of sub-directories available to sessionID in the startDir directory
+		"""
+		sessionID = self._session_id(sessionID)
+		url = self._api_url(sessionID, False) + "GetDirectories?sessionID=" + _pma_q(sessionID) + "&path=" + _pma_q(startDir)
+		json = self._http_get(url, sessionID).json()
 		if ("Code" in json):
-			raise Exception("ImageInfo to " + slideRef + " resulted in: " + json["Message"] + " (keep in mind that slideRef is case sensitive!)")
+			raise Exception("get_directories to " + startDir + " resulted in: " + json["Message"] + " (keep in mind that startDir is case sensitive!)")
 		elif ("d" in json):
-			_pma_slideinfos[sessionID][slideRef] = json["d"]
+			dirs  = json["d"]
 		else:
-			_pma_slideinfos[sessionID][slideRef] = json
-			
-	return _pma_slideinfos[sessionID][slideRef]
+			dirs = json
+		return dirs
 
-def get_max_zoomlevel(slideRef, sessionID = None):
-	"""
-	Determine the maximum zoomlevel that still represents an optical magnification
-	"""
-	info = get_slide_info(slideRef, sessionID)
-	if (info == None):
-		print("Unable to get information for", slideRef, " from ", sessionID)
-		return 0
-	else:
-		if ("MaxZoomLevel" in info): 
-			try:
-				return int(info["MaxZoomLevel"])
-			except:
-				print("Something went wrong consulting the MaxZoomLevel key in info{} dictionary; value =", info["MaxZoomLevel"])
-				return 0
+	def get_first_non_empty_directory(self, startDir = None, sessionID = None):
+		sessionID = self._session_id(sessionID)
+
+		if ((startDir is None) or (startDir == "")):
+			startDir = "/"
+		slides = self.get_slides(startDir = startDir, sessionID = sessionID)
+		if (len(slides) > 0):
+			return startDir
 		else:
-			try:
-				return int(info["NumberOfZoomLevels"])
-			except:
-				print("Something went wrong consulting the NumberOfZoomLevels key in info{} dictionary; value =", info["NumberOfZoomLevels"])
-				return 0
+			if (startDir == "/"):
+				for dir in self.get_root_directories(sessionID = sessionID):
+					nonEmtptyDir = self.get_first_non_empty_directory(startDir = dir, sessionID = sessionID)
+					if (not (nonEmtptyDir is None)):
+						return nonEmtptyDir
+			else:
+				for dir in self.get_directories(startDir, sessionID):
+					nonEmtptyDir = self.get_first_non_empty_directory(startDir = dir, sessionID = sessionID)
+					if (not (nonEmtptyDir is None)):
+						return nonEmtptyDir
+		return None
 
-def get_zoomlevels_list(slideRef, sessionID = None, min_number_of_tiles = 0):
-	"""
-	Obtain a list with all zoomlevels, starting with 0 and up to and including max_zoomlevel
-	Use min_number_of_tiles argument to specify that you're only interested in zoomlevels that include at lease a given number of tiles
-	"""
-	return sorted(list(get_zoomlevels_dict(slideRef, sessionID, min_number_of_tiles).keys()))
+	def get_slides(self, startDir, sessionID = None):
+		"""
+		Return an array of slides available to sessionID in the startDir directory
+		"""
+		sessionID = self._session_id(sessionID)
+		if (startDir.startswith("/")):
+			startDir = startDir[1:]		
+		url = self._api_url(sessionID, False) + "GetFiles?sessionID=" + _pma_q(sessionID) + "&path=" + _pma_q(startDir)	
+		json = self._http_get(url, sessionID).json()
+		if ("Code" in json):
+			raise Exception("get_slides from " + startDir + " resulted in: " + json["Message"] + " (keep in mind that startDir is case sensitive!)")
+		elif ("d" in json):
+			slides  = json["d"]
+		else:
+			slides = json
+		return slides
 
-def get_zoomlevels_dict(slideRef, sessionID = None, min_number_of_tiles = 0):
-	"""
-	Obtain a dictionary with the number of tiles per zoomlevel.
-	Information is returned as (x, y, n) tupels per zoomlevel, with 
-		x = number of horizontal tiles, 
-		y = number of vertical tiles, 
-		n = total number of tiles at specified zoomlevel (x * y)
-	Use min_number_of_tiles argument to specify that you're only interested in zoomlevels that include at lease a given number of tiles
-	"""
-	zoomlevels = list(range(0, get_max_zoomlevel(slideRef, sessionID) + 1))
-	dimensions = [ get_number_of_tiles(slideRef, z, sessionID) for z in zoomlevels if get_number_of_tiles(slideRef, z, sessionID)[2] > min_number_of_tiles]
-	d = dict(zip(zoomlevels[-len(dimensions):], dimensions))
+	def walk_slides(self, root = None, sessionID = None, workers = 8, catalog = None, max_age = 3600, with_uid = False, with_info = False):
+		"""
+		Find all slides in root (default: all root-directories) and its sub-directories, listing up to workers directories concurrently.
+		Slide paths are yielded as soon as they're found, in no particular order.
+		catalog can be a SlideCatalog (or a path to one) to record what is found; directories listed less than max_age seconds ago
+		are then taken from the catalog instead of being listed again (max_age = None trusts the catalog indefinitely).
+		with_uid and with_info also record the UID and slide information of newly found slides in the catalog.
+		"""
+		sessionID = self._session_id(sessionID)
+		server = self._url(sessionID)
+		if (isinstance(catalog, str)):
+			catalog = SlideCatalog(catalog)
+		if not (root is None):
+			root = root.strip("/")
+
+		def listing(directory):
+			# directory "" stands for the list of root-directories
+			cached = None if catalog is None else catalog.get_listing(server, directory, max_age)
+			if not (cached is None):
+				return cached
+			if (directory == ""):
+				(dirs, slides) = (self.get_root_directories(sessionID), [])
+			else:
+				(dirs, slides) = (self.get_directories(directory, sessionID), self.get_slides(directory, sessionID))
+			if not (catalog is None):
+				previous = catalog.get_listing(server, directory)
+				known = set() if previous is None else set(previous[1])
+				catalog.set_listing(server, directory, dirs, slides)
+				for slideRef in slides:
+					if (not slideRef in known and (with_uid or with_info)):
+						catalog.set_slide_details(server, slideRef, self.get_uid(slideRef, sessionID) if with_uid else None, self.get_slide_info(slideRef, sessionID) if with_info else None)
+			return (dirs, slides)
+
+		executor = ThreadPoolExecutor(max_workers = max(workers, 1))
+		pending = {executor.submit(listing, "" if not root else root)}
+		try:
+			while (len(pending) > 0):
+				done, pending = wait(pending, return_when = FIRST_COMPLETED)
+				for future in done:
+					(dirs, slides) = future.result()
+					for directory in dirs:
+						pending.add(executor.submit(listing, directory))
+					for slideRef in slides:
+						yield slideRef
+		finally:
+			for future in pending:
+				future.cancel()
+			executor.shutdown(wait = False)
+
+	def get_uid(self, slideRef, sessionID = None):
+		"""
+		Get the UID for a specific slide 
+		"""
+		sessionID = self._session_id(sessionID)
+		url = self._api_url(sessionID, False) + "GetUID?sessionID=" + _pma_q(sessionID) + "&path=" + _pma_q(slideRef)
+		json = self._http_get(url, sessionID).json()
+		if (isinstance(json, dict) and "Code" in json):
+			raise Exception("get_uid for " + slideRef + " resulted in: " + json["Message"] + " (keep in mind that slideRef is case sensitive!)")
+		return _pma_json_result(json)
 	
+	def sessions(self):
+		with self._lock:
+			return dict(self._sessions)
+
+	def get_tile_size(self, sessionID = None, slideRef = None):
+		"""
+		Get the (width, height) of the tiles of slideRef.
+		Without a slideRef, the tile size of an arbitrary slide available to sessionID is returned
+		"""
+		if not (slideRef is None):
+			return self.get_slide_geometry(slideRef, sessionID).tile_size
+		sessionID = self._session_id(sessionID)
+		if (len(self._slideinfo_cache(sessionID)) < 1):
+			dir = self.get_first_non_empty_directory(sessionID = sessionID)
+			slides = self.get_slides(dir, sessionID)
+			info = self.get_slide_info(slides[0], sessionID)
+		else:
+			info = choice(list(self._slideinfo_cache(sessionID).values()))
+		
+		return (int(info["TileSize"]), int(info["TileSize"]))
 	
-	return d
+	def get_slide_info(self, slideRef, sessionID = None):
+		"""
+		Return raw image information in the form of nested dictionaries
+		"""
+		sessionID = self._session_id(sessionID)
+		if (slideRef.startswith("/")):
+			slideRef = slideRef[1:]
+		
+		info = self._slideinfo_cache(sessionID).get(slideRef)
+		if not (info is None):
+			self._record_cache_hit(sessionID, "GetImageInfo", "memory")
+		else:
+			url = self._api_url(sessionID, False) + "GetImageInfo?SessionID=" + _pma_q(sessionID) +  "&pathOrUid=" + _pma_q(slideRef)
+			info = self._coalesce(url, sessionID, "GetImageInfo", lambda: self._load_slide_info(url, slideRef, sessionID))
+			
+		return info
+
+	def _load_slide_info(self, url, slideRef, sessionID):
+		info = self._stored_slide_info(slideRef, sessionID)
+		if (info is None):
+			json = self._http_get(url, sessionID).json()
+			if ("Code" in json):
+				raise Exception("ImageInfo to " + slideRef + " resulted in: " + json["Message"] + " (keep in mind that slideRef is case sensitive!)")
+			info = _pma_json_result(json)
+			self._store_slide_info(slideRef, sessionID, info)
+		self._slideinfo_cache(sessionID).put(slideRef, info)
+		return info
+
+	def set_slide_info_cache(self, max_entries = 10000, ttl = None, path = None):
+		"""
+		Configure how slide information (get_slide_info) is cached.
+		At most max_entries slides are kept in memory per session (least recently used ones are dropped first);
+		with ttl (in seconds) cached information is refreshed from PMA.core once it gets older than that.
+		Specify a path to also keep slide information in an sqlite database, keyed by slide UID, so it survives restarts
+		(and can be shared between processes); pass None to stop using it.
+		"""
+		self._slideinfo_max_entries = max_entries
+		self._slideinfo_ttl = ttl
+		for cache in list(self._slideinfos.values()):
+			cache.configure(max_entries, ttl)
+		store = None if path is None else _PmaSlideInfoStore(path)
+		with self._lock:
+			(old, self._slideinfo_store) = (self._slideinfo_store, store)
+		if not (old is None):
+			# other threads may still hold on to the old store; its close() lets them finish first
+			old.close()
+
+	def invalidate_slide_info(self, slideRef = None, sessionID = None):
+		"""
+		Forget the cached information of a slide (or of all slides, when slideRef is None) so it's requested from PMA.core again
+		"""
+		sessionID = self._session_id(sessionID)
+		if not (slideRef is None) and (slideRef.startswith("/")):
+			slideRef = slideRef[1:]
+		self._slideinfo_cache(sessionID).invalidate(slideRef)
+		store = self._slideinfo_store
+		if not (store is None):
+			store.invalidate(self._url(sessionID), slideRef)
+
+	def prefetch_slide_info(self, slideRefs, sessionID = None, workers = 8):
+		"""
+		Warm the slide information cache for many slides at once, requesting up to workers of them concurrently.
+		Keep in mind that only the last max_entries slides (see set_slide_info_cache) stay in memory.
+		Returns the list of slides for which no information could be obtained
+		"""
+		sessionID = self._session_id(sessionID)
+		def fetch(slideRef):
+			try:
+				self.get_slide_info(slideRef, sessionID)
+				return True
+			except Exception:
+				return False
+		return [slideRef for (slideRef, ok) in _pma_imap(fetch, slideRefs, workers, ordered = False) if not ok]
+
+	def get_slide_geometry(self, slideRef, sessionID = None):
+		"""
+		Get the SlideGeometry of a slide; it's derived once from get_slide_info and cached along with it,
+		so the geometry helpers (get_number_of_tiles, get_pixel_dimensions, ...) don't need any further requests
+		"""
+		sessionID = self._session_id(sessionID)
+		if (slideRef.startswith("/")):
+			slideRef = slideRef[1:]
+		geometry = self._slideinfo_cache(sessionID).get_geometry(slideRef)
+		if (geometry is None):
+			geometry = SlideGeometry(self.get_slide_info(slideRef, sessionID))
+			self._slideinfo_cache(sessionID).set_geometry(slideRef, geometry)
+		return geometry
+
+	def get_max_zoomlevel(self, slideRef, sessionID = None):
+		"""
+		Determine the maximum zoomlevel that still represents an optical magnification
+		"""
+		return self.get_slide_geometry(slideRef, sessionID).max_zoomlevel
+
+	def get_zoomlevels_list(self, slideRef, sessionID = None, min_number_of_tiles = 0):
+		"""
+		Obtain a list with all zoomlevels, starting with 0 and up to and including max_zoomlevel
+		Use min_number_of_tiles argument to specify that you're only interested in zoomlevels that include at lease a given number of tiles
+		"""
+		return sorted(list(self.get_zoomlevels_dict(slideRef, sessionID, min_number_of_tiles).keys()))
+
+	def get_zoomlevels_dict(self, slideRef, sessionID = None, min_number_of_tiles = 0):
+		"""
+		Obtain a dictionary with the number of tiles per zoomlevel.
+		Information is returned as (x, y, n) tupels per zoomlevel, with 
+			x = number of horizontal tiles, 
+			y = number of vertical tiles, 
+			n = total number of tiles at specified zoomlevel (x * y)
+		Use min_number_of_tiles argument to specify that you're only interested in zoomlevels that include at lease a given number of tiles
+		"""
+		return self.get_slide_geometry(slideRef, sessionID).zoomlevels_dict(min_number_of_tiles)
 	
-def get_pixels_per_micrometer(slideRef, zoomlevel = None, sessionID = None):
-	"""
-	Retrieve the physical dimension in terms of pixels per micrometer.
-	When zoomlevel is left to its default value of None, dimensions at the highest zoomlevel are returned 
-	(in effect returning the "native" resolution at which the slide was registered)
-	"""
-	maxZoomLevel = get_max_zoomlevel(slideRef, sessionID)
-	info = get_slide_info(slideRef, sessionID)
-	xppm = info["MicrometresPerPixelX"]
-	yppm = info["MicrometresPerPixelY"]
-	if (zoomlevel is None or zoomlevel == maxZoomLevel):
-		return (float(xppm), float(yppm))
-	else:
-		factor = 2 ** (zoomlevel - maxZoomLevel)
-		return (float(xppm) / factor, float(yppm) / factor)		
+	def get_pixels_per_micrometer(self, slideRef, zoomlevel = None, sessionID = None):
+		"""
+		Retrieve the physical dimension in terms of pixels per micrometer.
+		When zoomlevel is left to its default value of None, dimensions at the highest zoomlevel are returned 
+		(in effect returning the "native" resolution at which the slide was registered)
+		"""
+		return self.get_slide_geometry(slideRef, sessionID).microns_per_pixel(zoomlevel)
 	
-def get_pixel_dimensions(slideRef, zoomlevel = None, sessionID = None):
-	"""Get the total dimensions of a slide image at a given zoomlevel"""
-	maxZoomLevel = get_max_zoomlevel(slideRef, sessionID)
-	info = get_slide_info(slideRef, sessionID)
-	if (zoomlevel is None or zoomlevel == maxZoomLevel):
-		return (int(info["Width"]), int(info["Height"]))
-	else:
-		factor = 2 ** (zoomlevel - maxZoomLevel)
-		return (int(info["Width"]) * factor, int(info["Height"]) * factor)
-
-def get_number_of_tiles(slideRef, zoomlevel = None, sessionID = None):
-	"""Determine the number of tiles needed to reconstitute a slide at a given zoomlevel"""
-	pixels = get_pixel_dimensions(slideRef, zoomlevel, sessionID)
-	sz = get_tile_size(sessionID)
-	xtiles = int(ceil(pixels[0] / sz[0]))
-	ytiles = int(ceil(pixels[1] / sz[0]))
-	ntiles = xtiles * ytiles
-	return (xtiles, ytiles, ntiles)
+	def get_pixel_dimensions(self, slideRef, zoomlevel = None, sessionID = None):
+		"""Get the total dimensions of a slide image at a given zoomlevel"""
+		return self.get_slide_geometry(slideRef, sessionID).pixel_dimensions(zoomlevel)
+
+	def get_number_of_tiles(self, slideRef, zoomlevel = None, sessionID = None):
+		"""Determine the number of tiles needed to reconstitute a slide at a given zoomlevel"""
+		return self.get_slide_geometry(slideRef, sessionID).number_of_tiles(zoomlevel)
 	
-def get_physical_dimensions(slideRef, sessionID = None):
-	"""Determine the physical dimensions of the sample represented by the slide.
-	This is independent of the zoomlevel: the physical properties don't change because the magnification changes"""
-	ppmData = get_pixels_per_micrometer(slideRef, sessionID)
-	pixelSz = get_pixel_dimensions(slideRef, sessionID)
-	return (pixelSz[0] * ppmData[0], pixelSz[1] * ppmData[1])
+	def get_physical_dimensions(self, slideRef, sessionID = None):
+		"""Determine the physical dimensions of the sample represented by the slide.
+		This is independent of the zoomlevel: the physical properties don't change because the magnification changes"""
+		ppmData = self.get_pixels_per_micrometer(slideRef, sessionID = sessionID)
+		pixelSz = self.get_pixel_dimensions(slideRef, sessionID = sessionID)
+		return (pixelSz[0] * ppmData[0], pixelSz[1] * ppmData[1])
 			
-def get_number_of_channels(slideRef, sessionID = None):
-	"""Number of fluorescent channels for a slide (when slide is brightfield, return is always 1)"""
-	info = get_slide_info(slideRef, sessionID)
-	channels = info["TimeFrames"][0]["Layers"][0]["Channels"]
-	return len(channels)
-
-def get_number_of_layers(slideRef, sessionID = None):
-	"""Number of (z-stacked) layers for a slide"""
-	info = get_slide_info(slideRef, sessionID)
-	layers = info["TimeFrames"][0]["Layers"]
-	return len(layers)
+	def get_number_of_channels(self, slideRef, sessionID = None):
+		"""Number of fluorescent channels for a slide (when slide is brightfield, return is always 1)"""
+		return self.get_slide_geometry(slideRef, sessionID).number_of_channels
+
+	def get_number_of_layers(self, slideRef, sessionID = None):
+		"""Number of (z-stacked) layers for a slide"""
+		return self.get_slide_geometry(slideRef, sessionID).number_of_layers
 	
-def is_fluorescent(slideRef, sessionID = None):
-	"""Determine whether a slide is a fluorescent image or not"""
-	return get_number_of_channels(slideRef, sessionID) > 1
+	def is_fluorescent(self, slideRef, sessionID = None):
+		"""Determine whether a slide is a fluorescent image or not"""
+		return self.get_number_of_channels(slideRef, sessionID) > 1
 
-def is_multi_layer(slideRef, sessionID = None):
-	"""Determine whether a slide contains multiple (stacked) layers or not"""
-	return get_number_of_layers(slideRef, sessionID) > 1
+	def is_multi_layer(self, slideRef, sessionID = None):
+		"""Determine whether a slide contains multiple (stacked) layers or not"""
+		return self.get_number_of_layers(slideRef, sessionID) > 1
 
-def is_z_stack(slideRef, sessionID = None):
-	"""Determine whether a slide is a z-stack or not"""
-	return is_multi_layer(slideRef, sessionID)
+	def is_z_stack(self, slideRef, sessionID = None):
+		"""Determine whether a slide is a z-stack or not"""
+		return self.is_multi_layer(slideRef, sessionID)
 	
-def get_magnification(slideRef, zoomlevel = None, exact = False, sessionID = None):
-	"""Get the magnification represented at a certain zoomlevel"""
-	ppm = get_pixels_per_micrometer(slideRef, zoomlevel, sessionID)[0]
-	if (ppm > 0):
-		if (exact == True):
-			return round(40 / (ppm / 0.25))
+	def get_magnification(self, slideRef, zoomlevel = None, exact = False, sessionID = None):
+		"""Get the magnification represented at a certain zoomlevel"""
+		ppm = self.get_pixels_per_micrometer(slideRef, zoomlevel, sessionID)[0]
+		if (ppm > 0):
+			if (exact == True):
+				return round(40 / (ppm / 0.25))
+			else:
+				return round(40 / round(ppm / 0.25))
 		else:
-			return round(40 / round(ppm / 0.25))
-	else:
-		return 0
-
-def get_barcode_url(slideRef, sessionID = None):
-	"""Get the URL that points to the barcode (alias for "label") for a slide"""
-	sessionID = _pma_session_id(sessionID)
-	url = (_pma_url(sessionID) + "barcode"
-		+ "?SessionID=" + _pma_q(sessionID)
-		+ "&pathOrUid=" + _pma_q(slideRef))
-	return url
-
-def get_barcode_image(slideRef, sessionID = None):
-	"""Get the barcode (alias for "label") image for a slide"""
-	r = requests.get(get_barcode_url(slideRef, sessionID))
-	img = Image.open(BytesIO(r.content))
-	global _pma_amount_of_data_downloaded 
-	_pma_amount_of_data_downloaded[sessionID] += len(r.content)
-	return img
-
-def get_label_url(slideRef, sessionID = None):
-	"""Get the URL that points to the label for a slide"""
-	return get_barcode_url(slideRef, sessionID)
+			return 0
+
+	def get_metrics(self, sessionID = None):
+		"""
+		Get a snapshot of the requests made so far, as {sessionID: {endpoint: statistics}}, or just {endpoint: statistics} for one sessionID.
+		Endpoints are named after the PMA.core call (tile, thumbnail, GetImageInfo, GetFiles, ...) and their statistics hold
+		the number of requests, errors and retries, the bytes received, cache hits and latency (mean, p50, p90, p99, max and a histogram).
+		Requests made without a session (is_lite, connect, ...) are reported under sessionID None
+		"""
+		snapshot = dict()
+		with self._lock:
+			for ((sid, endpoint), metrics) in self._metrics.items():
+				snapshot.setdefault(sid, dict())[endpoint] = metrics.snapshot()
+		if (sessionID is None):
+			return snapshot
+		return snapshot.get(sessionID, dict())
+
+	def reset_metrics(self):
+		"""Start collecting metrics from scratch"""
+		with self._lock:
+			self._metrics.clear()
+
+	def add_request_hook(self, before = None, after = None):
+		"""
+		Register functions to be called around every request to PMA.core, e.g. to export metrics to a monitoring system:
+			before(sessionID, endpoint, url)
+			after(sessionID, endpoint, url, status, nbytes, seconds, error)
+		status is None and error is the exception raised when a request failed. Hooks may be called from several threads at once
+		"""
+		with self._lock:
+			if not (before is None):
+				self._request_hooks["before"].append(before)
+			if not (after is None):
+				self._request_hooks["after"].append(after)
+
+	def remove_request_hook(self, before = None, after = None):
+		"""Unregister functions registered with add_request_hook"""
+		with self._lock:
+			if not (before is None) and before in self._request_hooks["before"]:
+				self._request_hooks["before"].remove(before)
+			if not (after is None) and after in self._request_hooks["after"]:
+				self._request_hooks["after"].remove(after)
+
+	def set_tile_disk_cache(self, directory, max_bytes = 1024 ** 3):
+		"""
+		Keep the encoded tiles, thumbnails and labels downloaded by get_tile, get_thumbnail_image and get_label_image
+		in a local directory, so that later requests (also from later runs or from other processes) are served from disk.
+		Entries are keyed by PMA.core instance, slide UID and the exact request (x, y, zoomlevel, format, quality).
+		The least recently used entries are discarded once the directory grows beyond max_bytes.
+		Pass None as directory to switch the disk cache off again.
+		This is independent of the server-side cache that PMA.core itself uses when rendering tiles.
+		"""
+		cache = None if directory is None else _PmaDiskCache(directory, max_bytes)
+		with self._lock:
+			self._tile_disk_cache = cache
+
+	def get_tile_disk_cache_stats(self):
+		"""Get the hits, misses, evictions and size of the tile disk cache (counters are per process), or None when it's not in use"""
+		if (self._tile_disk_cache is None):
+			return None
+		return self._tile_disk_cache.stats()
+
+	def clear_tile_disk_cache(self):
+		"""Remove all entries from the tile disk cache"""
+		if not (self._tile_disk_cache is None):
+			self._tile_disk_cache.clear()
+
+	def set_tile_memory_cache(self, max_bytes = 256 * 1024 ** 2):
+		"""
+		Keep recently used decoded tiles in memory, up to max_bytes worth of pixels, so that overlapping reads
+		(sliding windows, neighbouring regions) reuse them instead of downloading and decoding them again.
+		The cache sits under get_tile and therefore also serves get_tiles and get_region.
+		Tiles handed out from the cache are shared: treat them as read-only (copy() them before drawing on them).
+		Pass None (or 0) to switch the memory cache off again.
+		"""
+		cache = _PmaMemoryCache(max_bytes) if max_bytes else None
+		with self._lock:
+			self._tile_memory_cache = cache
+
+	def get_tile_memory_cache_stats(self):
+		"""Get the hit rate and memory held by the decoded tile cache, or None when it's not in use"""
+		if (self._tile_memory_cache is None):
+			return None
+		return self._tile_memory_cache.stats()
+
+	def clear_tile_memory_cache(self):
+		"""Release all tiles held by the decoded tile cache"""
+		if not (self._tile_memory_cache is None):
+			self._tile_memory_cache.clear()
+
+	def set_tile_hedging(self, percentile = 95, min_seconds = 0.01, min_requests = 50):
+		"""
+		Hedge tile requests: when a tile takes longer than the given percentile of the tile latencies seen so far for its session,
+		request it a second time and use whichever response arrives first. This trims the slow tail of tile reads
+		(and hence of get_tiles and get_region) at the cost of a few percent more requests.
+		Hedging starts once a session has made min_requests tile requests and never fires sooner than min_seconds.
+		Latency percentiles come from get_metrics, whose histogram has power-of-two buckets, so the actual delay is approximate.
+		Pass None as percentile to switch hedging off again
+		"""
+		with self._lock:
+			if (percentile is None):
+				self._hedging = None
+				return
+			self._hedging = (percentile, min_seconds, min_requests)
+			if (self._hedge_executor is None):
+				self._hedge_executor = ThreadPoolExecutor(max_workers = 4 * self._http_pool_size)
+
+	def _overview_url(self, endpoint, slideRef, sessionID, width, height):
+		# URL of the thumbnail or barcode of a slide; with width and/or height, PMA.core scales the image down itself
+		url = (self._url(sessionID) + endpoint
+			+ "?SessionID=" + _pma_q(sessionID)
+			+ "&pathOrUid=" + _pma_q(slideRef))
+		if not (width is None):
+			url += "&w=" + _pma_q(width)
+		if not (height is None):
+			url += "&h=" + _pma_q(height)
+		return url
+
+	def _overview_image(self, endpoint, slideRef, sessionID, width, height, output, out, draft):
+		key = (endpoint, ) if (width is None and height is None) else (endpoint, width, height)
+		content = self._get_image_content(self._overview_url(endpoint, slideRef, sessionID, width, height), slideRef, sessionID, key)
+		return _pma_decode_image(content, output, out, draft)
+
+	def get_barcode_url(self, slideRef, sessionID = None, width = None, height = None):
+		"""Get the URL that points to the barcode (alias for "label") for a slide, scaled down server-side to fit width and/or height if specified"""
+		sessionID = self._session_id(sessionID)
+		return self._overview_url("barcode", slideRef, sessionID, width, height)
+
+	def get_barcode_image(self, slideRef, sessionID = None, output = "pil", out = None, draft = None, width = None, height = None):
+		"""
+		Get the barcode (alias for "label") image for a slide
+		See get_tile for the output, out and draft arguments and get_barcode_url for width and height
+		"""
+		sessionID = self._session_id(sessionID)
+		return self._overview_image("barcode", slideRef, sessionID, width, height, output, out, draft)
+
+	def get_label_url(self, slideRef, sessionID = None, width = None, height = None):
+		"""Get the URL that points to the label for a slide, scaled down server-side to fit width and/or height if specified"""
+		sessionID = self._session_id(sessionID)
+		return self._overview_url("barcode", slideRef, sessionID, width, height)
 	
-def get_label_image(slideRef, sessionID = None):
-	"""Get the label image for a slide"""
-	r = requests.get(get_label_url(slideRef, sessionID))
-	img = Image.open(BytesIO(r.content))
-	global _pma_amount_of_data_downloaded 
-	_pma_amount_of_data_downloaded[sessionID] += len(r.content)
-	return img
+	def get_label_image(self, slideRef, sessionID = None, output = "pil", out = None, draft = None, width = None, height = None):
+		"""
+		Get the label image for a slide
+		See get_tile for the output, out and draft arguments and get_label_url for width and height
+		"""
+		sessionID = self._session_id(sessionID)
+		return self._overview_image("barcode", slideRef, sessionID, width, height, output, out, draft)
 		
-def get_thumbnail_url(slideRef, sessionID = None):
-	"""Get the URL that points to the thumbnail for a slide"""
-	sessionID = _pma_session_id(sessionID)
-	url = (_pma_url(sessionID) + "thumbnail"
-		+ "?SessionID=" + _pma_q(sessionID)
-		+ "&pathOrUid=" + _pma_q(slideRef))
-	return url
+	def get_thumbnail_url(self, slideRef, sessionID = None, width = None, height = None):
+		"""Get the URL that points to the thumbnail for a slide, scaled down server-side to fit width and/or height if specified"""
+		sessionID = self._session_id(sessionID)
+		return self._overview_url("thumbnail", slideRef, sessionID, width, height)
 	
-def get_thumbnail_image(slideRef, sessionID = None):
-	"""Get the thumbnail image for a slide"""
-	r = requests.get(get_thumbnail_url(slideRef, sessionID))
-	img = Image.open(BytesIO(r.content))
-	global _pma_amount_of_data_downloaded 
-	_pma_amount_of_data_downloaded[sessionID] += len(r.content)
-	return img
-
-def get_tile(slideRef, x = 0, y = 0, zoomlevel = None, sessionID = None, format = "jpg", quality = 100): 
-	"""
-	Get a single tile at position (x, y)
-	Format can be 'jpg' or 'png'
-	Quality is an integer value and varies from 0 (as much compression as possible; not recommended) to 100 (100%, no compression)
-	"""
-	sessionID = _pma_session_id(sessionID)
-	if (zoomlevel is None):
-		zoomlevel = 0   # get_max_zoomlevel(slideRef, sessionID)
-
-	url = _pma_url(sessionID)
-	if url is None:
-		raise Exception("Unable to determine the PMA.core instance belonging to " + sessionID)
-
-	url += ("tile"
-		+ "?SessionID=" + _pma_q(sessionID)
-		+ "&channels=" + _pma_q("0")
-		+ "&timeframe=" + _pma_q("0")
-		+ "&layer=" + _pma_q("0")
-		+ "&pathOrUid=" + _pma_q(slideRef)
-		+ "&x=" + _pma_q(x)
-		+ "&y=" + _pma_q(y)
-		+ "&z=" + _pma_q(zoomlevel)	
-		+ "&format=" + _pma_q(format)
-		+ "&quality=" + _pma_q(quality)
-		+ "&cache=" + str(_pma_usecachewhenretrievingtiles).lower())
-	r = requests.get(url)
-	img = Image.open(BytesIO(r.content))
-	global _pma_amount_of_data_downloaded 
-	_pma_amount_of_data_downloaded[sessionID] += len(r.content)
-	return img
-
-def get_tiles(slideRef, fromX = 0, fromY = 0, toX = None, toY = None, zoomlevel = None, sessionID = None, format = "jpg", quality = 100):
-	"""
-	Get all tiles with a (fromX, fromY, toX, toY) rectangle. Navigate left to right, top to bottom
-	Format can be 'jpg' or 'png'
-	Quality is an integer value and varies from 0 (as much compression as possible; not recommended) to 100 (100%, no compression)
-	"""
-	sessionID = _pma_session_id(sessionID)
-
-	if (zoomlevel is None):
-		zoomlevel = 0   # get_max_zoomlevel(slideRef, sessionID)
-	if (toX is None):
-		toX = get_number_of_tiles(slideRef, zoomlevel, sessionID)[0]
-	if (toY is None):
-		toY = get_number_of_tiles(slideRef, zoomlevel, sessionID)[1]
-	for x in range(fromX, toX):
-		for y in range(fromY, toY):
-			yield get_tile(slideRef = slideRef, x = x, y = y, zoomlevel = zoomlevel, sessionID = sessionID, format = format, quality = quality)
+	def get_thumbnail_image(self, slideRef, sessionID = None, output = "pil", out = None, draft = None, width = None, height = None):
+		"""
+		Get the thumbnail image for a slide
+		See get_tile for the output, out and draft arguments and get_thumbnail_url for width and height
+		"""
+		sessionID = self._session_id(sessionID)
+		return self._overview_image("thumbnail", slideRef, sessionID, width, height, output, out, draft)
+
+	def _overviews(self, endpoint, slideRefs, size, sessionID, workers, prefetch, ordered, output):
+		sessionID = self._session_id(sessionID)
+		(width, height) = (None, None) if size is None else size
+		fetch = lambda slideRef: self._overview_image(endpoint, slideRef, sessionID, width, height, output, None, None)
+		for (slideRef, img) in _pma_imap(fetch, slideRefs, workers, prefetch, ordered):
+			yield img if ordered else (slideRef, img)
+
+	def get_thumbnails(self, slideRefs, size = None, sessionID = None, workers = 8, prefetch = None, ordered = True, output = "pil"):
+		"""
+		Get the thumbnails of many slides, workers at a time; at most prefetch (default 2 * workers) are requested ahead of the consumer.
+		With size = (width, height), PMA.core scales every thumbnail down to fit, so full-size thumbnails aren't transferred.
+		When ordered is False, (slideRef, thumbnail) pairs are yielded as soon as each thumbnail arrives instead of thumbnails in the order of slideRefs.
+		See get_tile for the output argument
+		"""
+		return self._overviews("thumbnail", slideRefs, size, sessionID, workers, prefetch, ordered, output)
+
+	def get_labels(self, slideRefs, size = None, sessionID = None, workers = 8, prefetch = None, ordered = True, output = "pil"):
+		"""Get the label images of many slides, workers at a time (see get_thumbnails)"""
+		return self._overviews("barcode", slideRefs, size, sessionID, workers, prefetch, ordered, output)
+
+	def _paste_overviews(self, endpoint, slideRefs, size, targets, sessionID, workers):
+		# fetch the images of slideRefs concurrently, each fitted within size and written into the top left corner of its target array
+		sessionID = self._session_id(sessionID)
+		def paste(item):
+			(slideRef, target) = item
+			img = self._overview_image(endpoint, slideRef, sessionID, size[0], size[1], "pil", None, None)
+			if (img.width > size[0] or img.height > size[1]):
+				# the server didn't scale the image down (far enough)
+				img.thumbnail(size)
+			_pma_image_output(img, "numpy", target)
+		for result in _pma_imap(paste, zip(slideRefs, targets), workers, ordered = False):
+			pass
+
+	def get_thumbnail_stack(self, slideRefs, size = (256, 256), sessionID = None, workers = 8, labels = False, out = None):
+		"""
+		Get the thumbnails (or with labels = True the label images) of many slides as one (n, height, width, 3) uint8 numpy array.
+		Every image is scaled down (server-side where possible) to fit size = (width, height), keeping its aspect ratio,
+		and written into the top left corner of its slot; the rest of the slot is left untouched in out and zero in a fresh array
+		"""
+		_pma_require_numpy()
+		slideRefs = list(slideRefs)
+		shape = (len(slideRefs), size[1], size[0], 3)
+		if (out is None):
+			out = np.zeros(shape, dtype = np.uint8)
+		elif (out.shape != shape):
+			raise Exception("get_thumbnail_stack needs an out array of shape " + str(shape) + ", got " + str(out.shape))
+		self._paste_overviews("barcode" if labels else "thumbnail", slideRefs, size, out, sessionID, workers)
+		return out
+
+	def get_contact_sheet(self, slideRefs, size = (256, 256), columns = None, sessionID = None, workers = 8, labels = False, output = "pil"):
+		"""
+		Get the thumbnails (or with labels = True the label images) of many slides laid out on a grid in one image, for a quick visual review.
+		Every cell is size = (width, height) pixels (see get_thumbnail_stack); columns defaults to a roughly square grid.
+		Cells are filled in the order of slideRefs, left to right and top to bottom. output is 'pil' or 'numpy'
+		"""
+		_pma_require_numpy()
+		slideRefs = list(slideRefs)
+		if (columns is None):
+			columns = max(int(ceil(len(slideRefs) ** 0.5)), 1)
+		rows = int(ceil(len(slideRefs) / columns))
+		(w, h) = size
+		sheet = np.zeros((rows * h, columns * w, 3), dtype = np.uint8)
+		cells = [sheet[(i // columns) * h:(i // columns + 1) * h, (i % columns) * w:(i % columns + 1) * w] for i in range(len(slideRefs))]
+		self._paste_overviews("barcode" if labels else "thumbnail", slideRefs, size, cells, sessionID, workers)
+		return Image.fromarray(sheet) if output == "pil" else sheet
+
+	def get_tile_url(self, slideRef, x = 0, y = 0, zoomlevel = None, sessionID = None, format = "jpg", quality = 100, channels = 0, timeframe = 0, layer = 0):
+		"""
+		Get the URL that points to a single tile at position (x, y)
+		channels is a channel index or a list of them (rendered together), layer the z-stack layer and timeframe the time point
+		"""
+		sessionID = self._session_id(sessionID)
+		if (zoomlevel is None):
+			zoomlevel = 0   # get_max_zoomlevel(slideRef, sessionID)
+
+		url = self._url(sessionID)
+		if url is None:
+			raise Exception("Unable to determine the PMA.core instance belonging to " + str(sessionID))
+
+		url += ("tile"
+			+ "?SessionID=" + _pma_q(sessionID)
+			+ "&channels=" + _pma_q(_pma_channels(channels))
+			+ "&timeframe=" + _pma_q(timeframe)
+			+ "&layer=" + _pma_q(layer)
+			+ "&pathOrUid=" + _pma_q(slideRef)
+			+ "&x=" + _pma_q(x)
+			+ "&y=" + _pma_q(y)
+			+ "&z=" + _pma_q(zoomlevel)	
+			+ "&format=" + _pma_q(format)
+			+ "&quality=" + _pma_q(quality)
+			+ "&cache=" + str(_pma_usecachewhenretrievingtiles).lower())
+		return url
+
+	def get_tile(self, slideRef, x = 0, y = 0, zoomlevel = None, sessionID = None, format = "jpg", quality = 100, output = "pil", out = None, draft = None, channels = 0, timeframe = 0, layer = 0): 
+		"""
+		Get a single tile at position (x, y), of the given channels, timeframe and layer (see get_tile_url)
+		Format can be 'jpg' or 'png'
+		Quality is an integer value and varies from 0 (as much compression as possible; not recommended) to 100 (100%, no compression)
+		Output can be 'pil' (a PIL Image), 'bytes' (the encoded tile as served, without decoding it) or 'numpy' (an (h, w, 3) uint8 array).
+		For 'numpy' output, out can be a reusable array the tile is decoded into; the part of it holding the tile is returned.
+		Arrays that aren't decoded into out are read-only.
+		draft = (width, height) lets the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding, to the smallest size that is
+		still at least that large; this is a lot cheaper than decoding at full resolution and resizing afterwards
+		"""
+		sessionID = self._session_id(sessionID)
+		if (zoomlevel is None):
+			zoomlevel = 0   # get_max_zoomlevel(slideRef, sessionID)
+
+		# the memory cache holds full-resolution decoded tiles, so it can't serve encoded or draft-decoded requests
+		cache = self._tile_memory_cache if (output != "bytes" and draft is None) else None
+		if not (cache is None):
+			key = (self._url(sessionID), slideRef.lstrip("/"), x, y, zoomlevel, format, quality) + _pma_plane_key(channels, timeframe, layer)
+			img = cache.get(key)
+			if not (img is None):
+				self._record_cache_hit(sessionID, "tile", "memory")
+				return _pma_image_output(img, output, out)
+
+		content = self._get_image_content(self.get_tile_url(slideRef, x, y, zoomlevel, sessionID, format, quality, channels, timeframe, layer), slideRef, sessionID,
+			("tile", x, y, zoomlevel, format, quality) + _pma_plane_key(channels, timeframe, layer), hedge = True)
+		if (cache is None):
+			return _pma_decode_image(content, output, out, draft)
+		img = Image.open(BytesIO(content))
+		# decode now rather than lazily, so the cache holds pixels and not just the encoded stream
+		img.load()
+		cache.put(key, img, img.width * img.height * len(img.getbands()))
+		return _pma_image_output(img, output, out)
+
+	def get_tiles(self, slideRef, fromX = 0, fromY = 0, toX = None, toY = None, zoomlevel = None, sessionID = None, format = "jpg", quality = 100, workers = 1, prefetch = None, ordered = True, output = "pil", out = None, draft = None, min_tissue_fraction = None, channels = 0, timeframe = 0, layer = 0, order = "column"):
+		"""
+		Get all tiles with a (fromX, fromY, toX, toY) rectangle, in the traversal order specified by order:
+		'column' (top to bottom, then left to right: the default), 'row' (left to right, then top to bottom),
+		'morton' (Z-order) or 'hilbert' (Hilbert curve). The latter two keep consecutive tiles close together in both directions,
+		which makes better use of the tile caches of both the client and PMA.core
+		Format can be 'jpg' or 'png'
+		Quality is an integer value and varies from 0 (as much compression as possible; not recommended) to 100 (100%, no compression)
+		Use workers > 1 to download tiles concurrently; at most prefetch tiles (default 2 * workers) are requested ahead of the consumer.
+		When ordered is False, (x, y, tile) tuples are yielded as soon as each tile arrives instead of tiles in grid order.
+		Keep workers at or below the transport pool size (see set_connection_options) to make full use of keep-alive connections
+		See get_tile for the output, out and draft arguments; when out is reused for 'numpy' output, every tile overwrites the previous one
+		With min_tissue_fraction, only tiles of which at least that fraction is covered by tissue (see get_tissue_tiles) are returned;
+		use ordered = False to know which tiles these are
+		channels, timeframe and layer select the plane the tiles are taken from (see get_tile_url)
+		"""
+		sessionID = self._session_id(sessionID)
+
+		if (zoomlevel is None):
+			zoomlevel = 0   # get_max_zoomlevel(slideRef, sessionID)
+		if (toX is None):
+			toX = self.get_number_of_tiles(slideRef, zoomlevel, sessionID)[0]
+		if (toY is None):
+			toY = self.get_number_of_tiles(slideRef, zoomlevel, sessionID)[1]
+		coordinates = _pma_tile_order(fromX, fromY, toX, toY, order)
+		if not (min_tissue_fraction is None):
+			tissue = set(self.get_tissue_tiles(slideRef, zoomlevel, min_tissue_fraction, sessionID))
+			coordinates = (xy for xy in coordinates if xy in tissue)
+		if (workers <= 1):
+			for (x, y) in coordinates:
+				tile = self.get_tile(slideRef = slideRef, x = x, y = y, zoomlevel = zoomlevel, sessionID = sessionID, format = format, quality = quality, output = output, out = out, draft = draft, channels = channels, timeframe = timeframe, layer = layer)
+				yield tile if ordered else (x, y, tile)
+		elif not (out is None):
+			# a single reusable buffer: download concurrently, but decode into out one tile at a time, as they're consumed
+			fetch = lambda xy: self.get_tile(slideRef = slideRef, x = xy[0], y = xy[1], zoomlevel = zoomlevel, sessionID = sessionID, format = format, quality = quality, output = "bytes", channels = channels, timeframe = timeframe, layer = layer)
+			for ((x, y), content) in _pma_imap(fetch, coordinates, workers, prefetch, ordered):
+				tile = _pma_decode_image(content, output, out, draft)
+				yield tile if ordered else (x, y, tile)
+		else:
+			fetch = lambda xy: self.get_tile(slideRef = slideRef, x = xy[0], y = xy[1], zoomlevel = zoomlevel, sessionID = sessionID, format = format, quality = quality, output = output, draft = draft, channels = channels, timeframe = timeframe, layer = layer)
+			for ((x, y), tile) in _pma_imap(fetch, coordinates, workers, prefetch, ordered):
+				yield tile if ordered else (x, y, tile)
+
+	def get_tiles_coarse_to_fine(self, slideRef, zoomlevels = None, sessionID = None, format = "jpg", quality = 100, workers = 1, prefetch = None, ordered = True,
+			output = "pil", draft = None, order = "hilbert", channels = 0, timeframe = 0, layer = 0):
+		"""
+		Get all tiles of several zoomlevels (default: all of them, see get_zoomlevels_list), the lowest zoomlevel first,
+		so that an overview of the whole slide is available early on and refined as higher zoomlevels come in.
+		Yields (zoomlevel, x, y, tile) tuples; within a zoomlevel tiles are traversed in order (see get_tiles).
+		See get_tiles for the other arguments; when ordered is False, tiles of the next zoomlevel can be yielded
+		before the last ones of the previous zoomlevel
+		"""
+		sessionID = self._session_id(sessionID)
+		geometry = self.get_slide_geometry(slideRef, sessionID)
+		zoomlevels = self.get_zoomlevels_list(slideRef, sessionID) if zoomlevels is None else sorted(zoomlevels)
+		schedule = ((z, x, y) for z in zoomlevels for (x, y) in _pma_tile_order(0, 0, geometry.xtiles[z], geometry.ytiles[z], order))
+		fetch = lambda zxy: self.get_tile(slideRef = slideRef, x = zxy[1], y = zxy[2], zoomlevel = zxy[0], sessionID = sessionID, format = format, quality = quality, output = output, draft = draft, channels = channels, timeframe = timeframe, layer = layer)
+		for ((z, x, y), tile) in _pma_imap(fetch, schedule, workers, prefetch, ordered):
+			yield (z, x, y, tile)
 			
-def show_slide(slideRef, sessionID = None):
-	"""Launch the default webbrowser and load a web-based viewer for the slide"""
-	sessionID = _pma_session_id(sessionID)
-	if (os.name == "posix"):
-		os_cmd = "open "
-	else:
-		os_cmd = "start "
+	def get_zoomlevel_for_mpp(self, slideRef, mpp, sessionID = None):
+		"""
+		Find the lowest zoomlevel that still resolves at least mpp micrometres per pixel,
+		i.e. the cheapest zoomlevel from which a region at that resolution can be read without upsampling
+		"""
+		maxZoomLevel = self.get_max_zoomlevel(slideRef, sessionID)
+		for zoomlevel in range(0, maxZoomLevel + 1):
+			# allow for a bit of rounding in the reported resolution
+			if (self.get_pixels_per_micrometer(slideRef, zoomlevel, sessionID)[0] <= mpp * 1.001):
+				return zoomlevel
+		return maxZoomLevel
+
+	def get_region(self, slideRef, x, y, w, h, zoomlevel = None, mpp = None, out = None, sessionID = None, format = "jpg", quality = 100, workers = 8, channels = 0, timeframe = 0, layer = 0):
+		"""
+		Get an arbitrary rectangle of a slide as an (h, w, 3) uint8 numpy array
+		By default (x, y, w, h) are pixel coordinates at zoomlevel, which defaults to the maximum zoomlevel.
+		When mpp is specified instead, (x, y, w, h) are in micrometres and the region is read at the lowest zoomlevel
+		that still offers mpp micrometres per pixel (see get_zoomlevel_for_mpp); the size of the result follows from that zoomlevel.
+		Only the tiles overlapping the rectangle are downloaded (workers at a time) and each one is written straight into
+		its slice of the result. Pass a preallocated array (or numpy.memmap) as out to avoid allocating one;
+		parts of the rectangle that fall outside of the slide are left untouched in out and zero in a fresh array.
+		channels, timeframe and layer select the plane the region is taken from (see get_tile_url)
+		"""
+		_pma_require_numpy()
+		sessionID = self._session_id(sessionID)
+		(zoomlevel, x, y, w, h) = self._region_level(slideRef, x, y, w, h, zoomlevel, mpp, sessionID)
+		if (out is None):
+			out = np.zeros((h, w, 3), dtype = np.uint8)
+		elif (out.shape != (h, w, 3)):
+			raise Exception("get_region needs an out array of shape " + str((h, w, 3)) + ", got " + str(out.shape))
+		self._paste_tiles(slideRef, zoomlevel, x, y, w, h, [(channels, timeframe, layer)], [out], sessionID, format, quality, workers)
+		return out
+
+	def _region_level(self, slideRef, x, y, w, h, zoomlevel, mpp, sessionID):
+		# resolve the zoomlevel of a region read and its rectangle in pixels at that zoomlevel
+		if (not (zoomlevel is None) and not (mpp is None)):
+			raise Exception("get_region takes either a zoomlevel or an mpp argument, not both")
+		if not (mpp is None):
+			zoomlevel = self.get_zoomlevel_for_mpp(slideRef, mpp, sessionID)
+			(xmpp, ympp) = self.get_pixels_per_micrometer(slideRef, zoomlevel, sessionID)
+			(x, y, w, h) = (int(x / xmpp), int(y / ympp), int(round(w / xmpp)), int(round(h / ympp)))
+		elif (zoomlevel is None):
+			zoomlevel = self.get_max_zoomlevel(slideRef, sessionID)
+		return (zoomlevel, int(x), int(y), int(w), int(h))
+
+	def _paste_tiles(self, slideRef, zoomlevel, x, y, w, h, planes, outs, sessionID, format, quality, workers):
+		# fetch the tiles overlapping the rectangle for every (channels, timeframe, layer) in planes, workers at a time,
+		# writing each into its slice of the matching array in outs: (h, w, 3) for color, (h, w) for intensity
+		geometry = self.get_slide_geometry(slideRef, sessionID)
+		tileSize = geometry.tile_size[0]
+		(xtiles, ytiles, ntiles) = geometry.number_of_tiles(zoomlevel)
+		(width, height) = geometry.pixel_dimensions(zoomlevel)
+		fromX, toX = max(x // tileSize, 0), min((x + w - 1) // tileSize + 1, xtiles)
+		fromY, toY = max(y // tileSize, 0), min((y + h - 1) // tileSize + 1, ytiles)
+
+		def paste(task):
+			(plane, tileX, tileY) = task
+			(channels, timeframe, layer) = planes[plane]
+			out = outs[plane]
+			(tx, ty) = (tileX * tileSize, tileY * tileSize)
+			if (out.ndim == 3 and tx >= x and ty >= y and tx + tileSize <= min(x + w, width) and ty + tileSize <= min(y + h, height)):
+				# the tile lies entirely within the rectangle and the level, so it can be decoded straight into its slice of out
+				self.get_tile(slideRef, tileX, tileY, zoomlevel, sessionID, format, quality, output = "numpy", out = out[ty - y:ty - y + tileSize, tx - x:tx - x + tileSize],
+					channels = channels, timeframe = timeframe, layer = layer)
+				return
+			tile = self.get_tile(slideRef, tileX, tileY, zoomlevel, sessionID, format, quality, output = "numpy", channels = channels, timeframe = timeframe, layer = layer)
+			# intersection of this tile with the requested rectangle and the level, in level coordinates:
+			# tiles along the right and bottom edges may be padded beyond the slide's pixel size
+			left, top = max(tx, x), max(ty, y)
+			right, bottom = min(tx + tile.shape[1], x + w, width), min(ty + tile.shape[0], y + h, height)
+			if (right > left and bottom > top):
+				if (out.ndim == 3):
+					out[top - y:bottom - y, left - x:right - x] = tile[top - ty:bottom - ty, left - tx:right - tx]
+				else:
+					# channels are rendered in their own color, so the brightest band holds the channel's intensity
+					np.max(tile[top - ty:bottom - ty, left - tx:right - tx], axis = 2, out = out[top - y:bottom - y, left - x:right - x])
+
+		tasks = ((plane, tileX, tileY) for plane in range(len(planes)) for tileY in range(fromY, toY) for tileX in range(fromX, toX))
+		for result in _pma_imap(paste, tasks, workers, ordered = False):
+			pass
+
+	def get_region_stack(self, slideRef, x, y, w, h, zoomlevel = None, mpp = None, channels = None, layers = None, timeframes = None, out = None,
+			sessionID = None, format = "jpg", quality = 100, workers = 8, rgb = False):
+		"""
+		Get a rectangle of several planes of a fluorescent, z-stacked and/or time-lapse slide as one (C, Z, T, h, w) uint8 numpy array.
+		channels, layers and timeframes are lists of indices (default: all the slide has); the rectangle is given as for get_region.
+		Every plane holds the intensity of one channel (the brightest band of the tile PMA.core renders for it); with rgb = True
+		the rendered colors are kept instead, in a (C, Z, T, h, w, 3) array.
+		All tiles of all planes are fetched workers at a time and written straight into out, which can be passed in preallocated
+		"""
+		_pma_require_numpy()
+		sessionID = self._session_id(sessionID)
+		(zoomlevel, x, y, w, h) = self._region_level(slideRef, x, y, w, h, zoomlevel, mpp, sessionID)
+		geometry = self.get_slide_geometry(slideRef, sessionID)
+		channels = range(geometry.number_of_channels) if channels is None else channels
+		layers = range(geometry.number_of_layers) if layers is None else layers
+		timeframes = range(geometry.number_of_timeframes) if timeframes is None else timeframes
+		shape = (len(channels), len(layers), len(timeframes), h, w) + ((3, ) if rgb else ())
+		if (out is None):
+			out = np.zeros(shape, dtype = np.uint8)
+		elif (out.shape != shape):
+			raise Exception("get_region_stack needs an out array of shape " + str(shape) + ", got " + str(out.shape))
+		planes, outs = [], []
+		for (c, channel) in enumerate(channels):
+			for (z, layer) in enumerate(layers):
+				for (t, timeframe) in enumerate(timeframes):
+					planes.append((channel, timeframe, layer))
+					outs.append(out[c, z, t])
+		self._paste_tiles(slideRef, zoomlevel, x, y, w, h, planes, outs, sessionID, format, quality, workers)
+		return out
+
+	def get_tile_stack(self, slideRef, x = 0, y = 0, zoomlevel = None, channels = None, layers = None, timeframes = None, out = None,
+			sessionID = None, format = "jpg", quality = 100, workers = 8, rgb = False):
+		"""
+		Get tile (x, y) of several planes as one (C, Z, T, h, w) uint8 numpy array (see get_region_stack), fetching the planes concurrently
+		"""
+		sessionID = self._session_id(sessionID)
+		geometry = self.get_slide_geometry(slideRef, sessionID)
+		if (zoomlevel is None):
+			zoomlevel = 0   # as get_tile
+		tileSize = geometry.tile_size[0]
+		(width, height) = geometry.pixel_dimensions(zoomlevel)
+		(tx, ty) = (x * tileSize, y * tileSize)
+		return self.get_region_stack(slideRef, tx, ty, min(tileSize, width - tx), min(tileSize, height - ty), zoomlevel, None, channels, layers, timeframes, out,
+			sessionID, format, quality, workers, rgb)
+
+	def get_tissue_mask(self, slideRef, sessionID = None, zoomlevel = None, min_saturation = 20):
+		"""
+		Get a boolean numpy array that marks where a slide holds tissue rather than empty glass.
+		The mask is computed with Otsu thresholding on the saturation of a low-resolution version of the whole slide:
+		by default the lowest zoomlevel that is at least 1024 pixels wide or high; specify zoomlevel = "thumbnail"
+		to use the thumbnail instead, or any other zoomlevel. Pixels less saturated than min_saturation (0-255) are never tissue.
+		Masks are cached per slide
+		"""
+		_pma_require_numpy()
+		sessionID = self._session_id(sessionID)
+		geometry = self.get_slide_geometry(slideRef, sessionID)
+		if (zoomlevel is None):
+			zoomlevel = next((z for z in range(0, geometry.max_zoomlevel + 1) if max(geometry.pixel_dimensions(z)) >= 1024), geometry.max_zoomlevel)
+
+		key = (self._url(sessionID), slideRef.lstrip("/"), zoomlevel, min_saturation)
+		mask = self._tissue_masks.get(key)
+		if (mask is None):
+			if (zoomlevel == "thumbnail"):
+				img = self.get_thumbnail_image(slideRef, sessionID)
+			else:
+				(w, h) = geometry.pixel_dimensions(zoomlevel)
+				img = Image.fromarray(self.get_region(slideRef, 0, 0, w, h, zoomlevel = zoomlevel, sessionID = sessionID))
+			saturation = np.asarray(img.convert("RGB").convert("HSV"))[:, :, 1]
+			mask = saturation > max(_pma_otsu_threshold(saturation), min_saturation)
+			mask.setflags(write = False)
+			self._tissue_masks.put(key, mask, mask.nbytes)
+		return mask
+
+	def get_tissue_tiles(self, slideRef, zoomlevel = None, min_tissue_fraction = 0.1, sessionID = None, mask = None):
+		"""
+		List the (x, y) coordinates of the tiles at zoomlevel (default: the maximum zoomlevel) of which at least
+		min_tissue_fraction is covered by tissue, column by column, as get_tiles traverses them by default.
+		The tissue mask (see get_tissue_mask) is mapped onto the tile grid of zoomlevel using the slide's geometry;
+		pass a mask of your own to use that one instead
+		"""
+		_pma_require_numpy()
+		sessionID = self._session_id(sessionID)
+		geometry = self.get_slide_geometry(slideRef, sessionID)
+		if (zoomlevel is None):
+			zoomlevel = geometry.max_zoomlevel
+		if (mask is None):
+			mask = self.get_tissue_mask(slideRef, sessionID)
+		(width, height) = geometry.pixel_dimensions(zoomlevel)
+		(xtiles, ytiles, ntiles) = geometry.number_of_tiles(zoomlevel)
+		tileSize = geometry.tile_size[0]
+		(mh, mw) = mask.shape
+
+		# the mask covers the whole slide, so tile edges map onto it proportionally; every tile covers at least one mask pixel
+		x0 = np.floor(np.arange(xtiles) * tileSize * mw / width).astype(np.int64)
+		x1 = np.maximum(np.ceil(np.minimum(np.arange(1, xtiles + 1) * tileSize, width) * mw / width).astype(np.int64), x0 + 1)
+		y0 = np.floor(np.arange(ytiles) * tileSize * mh / height).astype(np.int64)
+		y1 = np.maximum(np.ceil(np.minimum(np.arange(1, ytiles + 1) * tileSize, height) * mh / height).astype(np.int64), y0 + 1)
+		(x0, x1, y0, y1) = (np.minimum(x0, mw - 1), np.minimum(x1, mw), np.minimum(y0, mh - 1), np.minimum(y1, mh))
+
+		# tissue pixels per tile from a summed-area table, indexed [x, y]
+		table = np.zeros((mh + 1, mw + 1), dtype = np.int64)
+		table[1:, 1:] = np.cumsum(np.cumsum(mask, axis = 0), axis = 1)
+		tissue = (table[y1[None, :], x1[:, None]] - table[y0[None, :], x1[:, None]] - table[y1[None, :], x0[:, None]] + table[y0[None, :], x0[:, None]])
+		fraction = tissue / ((x1 - x0)[:, None] * (y1 - y0)[None, :])
+		return [(int(x), int(y)) for (x, y) in zip(*np.nonzero(fraction >= min_tissue_fraction))]
+
+	def sample_patches(self, slideRefs, size = 256, mpp = None, strategy = "random", patches_per_slide = 16, stride = None, min_tissue_fraction = None,
+			batch_size = 32, seed = 0, drop_last = False, sessionID = None, workers = 8, prefetch = None, format = "jpg", quality = 100):
+		"""
+		Stream fixed-shape batches of square patches sampled from many slides, e.g. to feed a training loop.
+		Yields (patches, locations) pairs: patches is a (batch_size, size, size, 3) uint8 numpy array (the last batch can be smaller
+		unless drop_last = True), locations lists (slideRef, zoomlevel, x, y, w, h) of every patch, in pixels at that zoomlevel.
+		Patches are read at mpp micrometres per pixel (default: the native resolution of each slide), from the lowest zoomlevel
+		that offers it (see get_zoomlevel_for_mpp) and resized to size x size pixels where that zoomlevel's resolution differs.
+		strategy is "random" (patches_per_slide patches at random positions of every slide, visiting the slides in random order;
+		the patches of batch_size slides at a time are shuffled together, so every batch mixes several slides)
+		or "grid" (all patches, stride pixels apart at mpp (default: size), slide by slide, row by row).
+		With min_tissue_fraction, only patches at least that much covered by tissue are taken (see get_tissue_mask).
+		The same seed yields the same patches in the same order. Patches are fetched by workers threads ahead of the consumer,
+		at most prefetch (default: two batches) of them at a time; the slide information and tissue masks of upcoming slides
+		are fetched ahead on workers threads as well
+		"""
+		_pma_require_numpy()
+		if not (strategy in ("random", "grid")):
+			raise Exception("strategy must be \"random\" or \"grid\", got " + str(strategy))
+		sessionID = self._session_id(sessionID)
+		slideRefs = list(slideRefs)
+		rng = Random(seed)
+		if (strategy == "random"):
+			rng.shuffle(slideRefs)
+		if (prefetch is None):
+			prefetch = 2 * batch_size
+
+		def prepare(slideRef):
+			# zoomlevel, size and tissue mask of a slide, worked out on the workers ahead of plan(); None for slides that are too small
+			if (mpp is None):
+				zoomlevel, scale = self.get_max_zoomlevel(slideRef, sessionID), 1.0
+			else:
+				zoomlevel = self.get_zoomlevel_for_mpp(slideRef, mpp, sessionID)
+				scale = mpp / self.get_pixels_per_micrometer(slideRef, zoomlevel, sessionID)[0]
+			(width, height) = self.get_slide_geometry(slideRef, sessionID).pixel_dimensions(zoomlevel)
+			read = max(int(round(size * scale)), 1)
+			if (read > width or read > height):
+				return None
+			mask = None if min_tissue_fraction is None else self.get_tissue_mask(slideRef, sessionID)
+			return (zoomlevel, scale, width, height, read, mask)
+
+		def draw(slideRef, level):
+			# patch locations are drawn on the consumer's thread, in the order of the slides, so they only depend on the seed
+			(zoomlevel, scale, width, height, read, mask) = level
+			def accept(x, y):
+				return mask is None or _pma_mask_fraction(mask, width, height, x, y, read, read) >= min_tissue_fraction
+			if (strategy == "grid"):
+				step = max(int(round((size if stride is None else stride) * scale)), 1)
+				for y in range(0, height - read + 1, step):
+					for x in range(0, width - read + 1, step):
+						if (accept(x, y)):
+							yield (slideRef, zoomlevel, x, y, read, read)
+			else:
+				# rejection sampling; slides with (nearly) no tissue give up after a bounded number of attempts
+				found = 0
+				for attempt in range(patches_per_slide * (1 if mask is None else 100)):
+					(x, y) = (rng.randint(0, width - read), rng.randint(0, height - read))
+					if (accept(x, y)):
+						yield (slideRef, zoomlevel, x, y, read, read)
+						found += 1
+						if (found == patches_per_slide):
+							break
+
+		def plan():
+			mix = 1 if strategy == "grid" else batch_size
+			levels = ((slideRef, level) for (slideRef, level) in _pma_imap(prepare, slideRefs, workers, max(2 * mix, workers)) if not (level is None))
+			if (strategy == "grid"):
+				for (slideRef, level) in levels:
+					for location in draw(slideRef, level):
+						yield location
+				return
+			# the patches of mix slides at a time are shuffled together, so batches don't come from a single slide
+			while True:
+				group = list(islice(levels, mix))
+				if (len(group) == 0):
+					break
+				locations = [location for (slideRef, level) in group for location in draw(slideRef, level)]
+				rng.shuffle(locations)
+				for location in locations:
+					yield location
+
+		def fetch(location):
+			(slideRef, zoomlevel, x, y, w, h) = location
+			region = self.get_region(slideRef, x, y, w, h, zoomlevel, sessionID = sessionID, format = format, quality = quality, workers = 1)
+			if (w != size):
+				region = np.asarray(Image.fromarray(region).resize((size, size), Image.BILINEAR))
+			return region
+
+		patches, locations = None, []
+		for (location, patch) in _pma_imap(fetch, plan(), workers, prefetch):
+			if (patches is None):
+				# a fresh array per batch, as the consumer may still hold on to the previous one
+				patches = np.empty((batch_size, size, size, 3), dtype = np.uint8)
+			patches[len(locations)] = patch
+			locations.append(location)
+			if (len(locations) == batch_size):
+				yield (patches, locations)
+				patches, locations = None, []
+		if (len(locations) > 0 and not drop_last):
+			yield (patches[:len(locations)], locations)
+
+	def export_level(self, slideRef, zoomlevel = None, dest = ".", chunk = None, sessionID = None, format = "jpg", quality = 100, workers = 8):
+		"""
+		Write a zoomlevel (default: the maximum zoomlevel) of a slide to dest as an uncompressed .npy array,
+		so it can be read back without HTTP requests or decoding (see open_level).
+		The level is fetched in square chunks of chunk pixels (default: the tile size), workers chunks at a time,
+		each decoded straight into its place in the memory-mapped file. Written chunks are recorded next to the array,
+		so calling export_level again after an interruption only fetches what is still missing.
+		Returns the path of the array
+		"""
+		_pma_require_numpy()
+		sessionID = self._session_id(sessionID)
+		geometry = self.get_slide_geometry(slideRef, sessionID)
+		if (zoomlevel is None):
+			zoomlevel = geometry.max_zoomlevel
+		if (chunk is None):
+			chunk = geometry.tile_size[0]
+		(width, height) = geometry.pixel_dimensions(zoomlevel)
+		(xchunks, ychunks) = (int(ceil(width / chunk)), int(ceil(height / chunk)))
+
+		os.makedirs(dest, exist_ok = True)
+		(path, donePath) = _pma_level_paths(dest, zoomlevel)
+		if (os.path.exists(path) and os.path.exists(donePath)):
+			pixels = np.load(path, mmap_mode = "r+")
+			done = np.load(donePath, mmap_mode = "r+")
+			if (pixels.shape != (height, width, 3) or done.shape != (ychunks, xchunks)):
+				raise Exception("An export of a different slide or with a different chunk size exists in " + dest + "; remove it or pick another destination")
+		else:
+			# the pixel file starts out sparse; only the chunks that get written take up disk space
+			pixels = np.lib.format.open_memmap(path, mode = "w+", dtype = np.uint8, shape = (height, width, 3))
+			done = np.lib.format.open_memmap(donePath, mode = "w+", dtype = np.uint8, shape = (ychunks, xchunks))
+
+		def write(cxy):
+			(cx, cy) = cxy
+			(x, y) = (cx * chunk, cy * chunk)
+			(w, h) = (min(chunk, width - x), min(chunk, height - y))
+			self.get_region(slideRef, x, y, w, h, zoomlevel, out = pixels[y:y + h, x:x + w], sessionID = sessionID, format = format, quality = quality, workers = 1)
+			# mark the chunk only once its pixels are in place, so an interrupted export never skips a chunk
+			done[cy, cx] = 1
+
+		try:
+			missing = [(cx, cy) for cy in range(ychunks) for cx in range(xchunks) if not done[cy, cx]]
+			for result in _pma_imap(write, missing, workers, ordered = False):
+				pass
+		finally:
+			pixels.flush()
+			done.flush()
+		return path
+
+	def export_pyramid(self, slideRef, dest = ".", zoomlevels = None, chunk = None, sessionID = None, format = "jpg", quality = 100, workers = 8):
+		"""
+		Export several zoomlevels of a slide (default: all of them) with export_level, lowest resolution first.
+		The slide information is saved as slide.json alongside them. Returns {zoomlevel: path}
+		"""
+		sessionID = self._session_id(sessionID)
+		if (zoomlevels is None):
+			zoomlevels = self.get_zoomlevels_list(slideRef, sessionID)
+		os.makedirs(dest, exist_ok = True)
+		fd, tmp = tempfile.mkstemp(dir = dest, prefix = ".")
+		with os.fdopen(fd, "w") as f:
+			f.write(_pma_dumps({"slideRef": slideRef, "info": self.get_slide_info(slideRef, sessionID)}))
+		os.replace(tmp, os.path.join(dest, "slide.json"))
+		return {zoomlevel: self.export_level(slideRef, zoomlevel, dest, chunk, sessionID, format, quality, workers) for zoomlevel in sorted(zoomlevels)}
+
+	def show_slide(self, slideRef, sessionID = None):
+		"""Launch the default webbrowser and load a web-based viewer for the slide"""
+		sessionID = self._session_id(sessionID)
+		if (os.name == "posix"):
+			os_cmd = "open "
+		else:
+			os_cmd = "start "
 	
-	if (sessionID == _pma_pmacoreliteSessionID):
-		url = "http://free.pathomation.com/pma-view-lite/?path=" + _pma_q(slideRef)
-	else:
-		url = _pma_url(sessionID)
-		if url is None:
-			raise Exception("Unable to determine the PMA.core instance belonging to " + sessionID)
+		if (sessionID == _pma_pmacoreliteSessionID):
+			url = "http://free.pathomation.com/pma-view-lite/?path=" + _pma_q(slideRef)
+		else:
+			url = self._url(sessionID)
+			if url is None:
+				raise Exception("Unable to determine the PMA.core instance belonging to " + sessionID)
+			else:
+				url += ("viewer/index.htm"
+				+ "?sessionID=" + _pma_q(sessionID)
+				+ "^&pathOrUid=" + _pma_q(slideRef))    # note the ^& to escape a regular &
+		os.system(os_cmd+url)
+
+	# asyncio API; these mirror their blocking counterparts above and require aiohttp
+
+	async def aclose_connections(self):
+		"""Close the connections that the asyncio API opened from the running event loop"""
+		with self._lock:
+			sessions = self._aio_sessions.pop(asyncio.get_running_loop(), dict())
+		for (session, semaphore) in sessions.values():
+			await session.close()
+
+	async def aget_directories(self, startDir, sessionID = None):
+		"""
+		Return an array of sub-directories available to sessionID in the startDir directory
+		"""
+		sessionID = self._session_id(sessionID)
+		url = self._api_url(sessionID, False) + "GetDirectories?sessionID=" + _pma_q(sessionID) + "&path=" + _pma_q(startDir)
+		json = _pma_loads(await self._aio_get(url, sessionID))
+		if ("Code" in json):
+			raise Exception("get_directories to " + startDir + " resulted in: " + json["Message"] + " (keep in mind that startDir is case sensitive!)")
+		return _pma_json_result(json)
+
+	async def aget_slides(self, startDir, sessionID = None):
+		"""
+		Return an array of slides available to sessionID in the startDir directory
+		"""
+		sessionID = self._session_id(sessionID)
+		if (startDir.startswith("/")):
+			startDir = startDir[1:]		
+		url = self._api_url(sessionID, False) + "GetFiles?sessionID=" + _pma_q(sessionID) + "&path=" + _pma_q(startDir)	
+		json = _pma_loads(await self._aio_get(url, sessionID))
+		if ("Code" in json):
+			raise Exception("get_slides from " + startDir + " resulted in: " + json["Message"] + " (keep in mind that startDir is case sensitive!)")
+		return _pma_json_result(json)
+
+	async def aget_slide_info(self, slideRef, sessionID = None):
+		"""
+		Return raw image information in the form of nested dictionaries; shares its cache with get_slide_info()
+		"""
+		sessionID = self._session_id(sessionID)
+		if (slideRef.startswith("/")):
+			slideRef = slideRef[1:]
+
+		info = self._slideinfo_cache(sessionID).get(slideRef)
+		if not (info is None):
+			self._record_cache_hit(sessionID, "GetImageInfo", "memory")
 		else:
-			url += ("viewer/index.htm"
-			+ "?sessionID=" + _pma_q(sessionID)
-			+ "^&pathOrUid=" + _pma_q(slideRef))    # note the ^& to escape a regular &
-	os.system(os_cmd+url)
-6
\ No newline at end of file
+			url = self._api_url(sessionID, False) + "GetImageInfo?SessionID=" + _pma_q(sessionID) +  "&pathOrUid=" + _pma_q(slideRef)
+			info = await self._aio_coalesce(url, sessionID, "GetImageInfo", lambda: self._aload_slide_info(url, slideRef, sessionID))
+
+		return info
+
+	async def _aload_slide_info(self, url, slideRef, sessionID):
+		# the sqlite store, and the UID lookup (get_uid) that storing may need, block; they run on the loop's default executor
+		loop = asyncio.get_running_loop()
+		info = None
+		if not (self._slideinfo_store is None):
+			info = await loop.run_in_executor(None, self._stored_slide_info, slideRef, sessionID)
+		if (info is None):
+			json = _pma_loads(await self._aio_get(url, sessionID))
+			if ("Code" in json):
+				raise Exception("ImageInfo to " + slideRef + " resulted in: " + json["Message"] + " (keep in mind that slideRef is case sensitive!)")
+			info = _pma_json_result(json)
+			if not (self._slideinfo_store is None):
+				await loop.run_in_executor(None, self._store_slide_info, slideRef, sessionID, info)
+		self._slideinfo_cache(sessionID).put(slideRef, info)
+		return info
+
+	async def aget_tile(self, slideRef, x = 0, y = 0, zoomlevel = None, sessionID = None, format = "jpg", quality = 100, output = "pil", out = None, draft = None, channels = 0, timeframe = 0, layer = 0):
+		"""
+		Get a single tile at position (x, y); see get_tile()
+		"""
+		sessionID = self._session_id(sessionID)
+		url = self.get_tile_url(slideRef, x, y, zoomlevel, sessionID, format, quality, channels, timeframe, layer)
+		(content, status) = await self._aio_coalesce(url, sessionID, "tile", lambda: self._aio_hedged_get(url, sessionID))
+		_pma_check_image_status(url, slideRef, status)
+		if (output == "bytes"):
+			return content
+		# decoding (and waiting for the process decoder, see set_decode_processes) would block the event loop
+		return await asyncio.get_running_loop().run_in_executor(None, _pma_decode_image, content, output, out, draft)
+
+	async def aget_tiles(self, slideRef, fromX = 0, fromY = 0, toX = None, toY = None, zoomlevel = None, sessionID = None, format = "jpg", quality = 100, prefetch = 32, ordered = True, output = "pil", draft = None, channels = 0, timeframe = 0, layer = 0, order = "column"):
+		"""
+		Asynchronously iterate over all tiles with a (fromX, fromY, toX, toY) rectangle (async for tile in aget_tiles(...)), traversed in order (see get_tiles)
+		At most prefetch tiles are requested ahead of the consumer; the total number of requests in flight per session
+		is further capped by set_connection_options(async_concurrency = ...)
+		When ordered is False, (x, y, tile) tuples are yielded as soon as each tile arrives instead of tiles in grid order
+		"""
+		sessionID = self._session_id(sessionID)
+
+		if (zoomlevel is None):
+			zoomlevel = 0   # get_max_zoomlevel(slideRef, sessionID)
+		if (toX is None or toY is None):
+			# warm the slide info cache first, so the geometry helpers below don't block the event loop
+			await self.aget_slide_info(slideRef, sessionID)
+			(xtiles, ytiles, ntiles) = self.get_number_of_tiles(slideRef, zoomlevel, sessionID)
+			if (toX is None):
+				toX = xtiles
+			if (toY is None):
+				toY = ytiles
+		coordinates = _pma_tile_order(fromX, fromY, toX, toY, order)
+		fetch = lambda xy: self.aget_tile(slideRef = slideRef, x = xy[0], y = xy[1], zoomlevel = zoomlevel, sessionID = sessionID, format = format, quality = quality, output = output, draft = draft, channels = channels, timeframe = timeframe, layer = layer)
+		async for ((x, y), tile) in _pma_aio_imap(fetch, coordinates, prefetch, ordered):
+			yield tile if ordered else (x, y, tile)
+
+# the module-level API: the methods of a default client, so that code written against the functions keeps working
+
+_pma_client = PMAClient()
+
+def get_default_client():
+	"""Get the PMAClient that the module-level functions (connect, get_tile, ...) operate on"""
+	return _pma_client
+
+is_lite = _pma_client.is_lite
+get_version_info = _pma_client.get_version_info
+set_connection_options = _pma_client.set_connection_options
+connect = _pma_client.connect
+disconnect = _pma_client.disconnect
+connect_replicas = _pma_client.connect_replicas
+get_replica_status = _pma_client.get_replica_status
+get_worker_state = _pma_client.get_worker_state
+init_worker = _pma_client.init_worker
+get_root_directories = _pma_client.get_root_directories
+get_directories = _pma_client.get_directories
+get_first_non_empty_directory = _pma_client.get_first_non_empty_directory
+get_slides = _pma_client.get_slides
+walk_slides = _pma_client.walk_slides
+get_uid = _pma_client.get_uid
+sessions = _pma_client.sessions
+get_tile_size = _pma_client.get_tile_size
+get_slide_info = _pma_client.get_slide_info
+set_slide_info_cache = _pma_client.set_slide_info_cache
+invalidate_slide_info = _pma_client.invalidate_slide_info
+prefetch_slide_info = _pma_client.prefetch_slide_info
+get_slide_geometry = _pma_client.get_slide_geometry
+get_max_zoomlevel = _pma_client.get_max_zoomlevel
+get_zoomlevels_list = _pma_client.get_zoomlevels_list
+get_zoomlevels_dict = _pma_client.get_zoomlevels_dict
+get_pixels_per_micrometer = _pma_client.get_pixels_per_micrometer
+get_pixel_dimensions = _pma_client.get_pixel_dimensions
+get_number_of_tiles = _pma_client.get_number_of_tiles
+get_physical_dimensions = _pma_client.get_physical_dimensions
+get_number_of_channels = _pma_client.get_number_of_channels
+get_number_of_layers = _pma_client.get_number_of_layers
+is_fluorescent = _pma_client.is_fluorescent
+is_multi_layer = _pma_client.is_multi_layer
+is_z_stack = _pma_client.is_z_stack
+get_magnification = _pma_client.get_magnification
+get_metrics = _pma_client.get_metrics
+reset_metrics = _pma_client.reset_metrics
+add_request_hook = _pma_client.add_request_hook
+remove_request_hook = _pma_client.remove_request_hook
+set_tile_disk_cache = _pma_client.set_tile_disk_cache
+get_tile_disk_cache_stats = _pma_client.get_tile_disk_cache_stats
+clear_tile_disk_cache = _pma_client.clear_tile_disk_cache
+set_tile_memory_cache = _pma_client.set_tile_memory_cache
+get_tile_memory_cache_stats = _pma_client.get_tile_memory_cache_stats
+clear_tile_memory_cache = _pma_client.clear_tile_memory_cache
+set_tile_hedging = _pma_client.set_tile_hedging
+get_barcode_url = _pma_client.get_barcode_url
+get_barcode_image = _pma_client.get_barcode_image
+get_label_url = _pma_client.get_label_url
+get_label_image = _pma_client.get_label_image
+get_thumbnail_url = _pma_client.get_thumbnail_url
+get_thumbnail_image = _pma_client.get_thumbnail_image
+get_thumbnails = _pma_client.get_thumbnails
+get_labels = _pma_client.get_labels
+get_thumbnail_stack = _pma_client.get_thumbnail_stack
+get_contact_sheet = _pma_client.get_contact_sheet
+get_tile_url = _pma_client.get_tile_url
+get_tile = _pma_client.get_tile
+get_tiles = _pma_client.get_tiles
+get_tiles_coarse_to_fine = _pma_client.get_tiles_coarse_to_fine
+get_zoomlevel_for_mpp = _pma_client.get_zoomlevel_for_mpp
+get_region = _pma_client.get_region
+get_region_stack = _pma_client.get_region_stack
+get_tile_stack = _pma_client.get_tile_stack
+get_tissue_mask = _pma_client.get_tissue_mask
+get_tissue_tiles = _pma_client.get_tissue_tiles
+sample_patches = _pma_client.sample_patches
+export_level = _pma_client.export_level
+export_pyramid = _pma_client.export_pyramid
+show_slide = _pma_client.show_slide
+aclose_connections = _pma_client.aclose_connections
+aget_directories = _pma_client.aget_directories
+aget_slides = _pma_client.aget_slides
+aget_slide_info = _pma_client.aget_slide_info
+aget_tile = _pma_client.aget_tile
+aget_tiles = _pma_client.aget_tiles
@@ -17,5 +17,6 @@ setup(name='pma_python',
 		'Programming Language :: Python :: 3'],
 	  keywords='wsi whole slide imaging gigapixel microscopy histology pathology',
 	  install_requires=['pillow', 'requests'],
+	  extras_require={'numpy': ['numpy'], 'async': ['aiohttp']},
 	  python_requires='>=3',	# assume this only works in Python 3
       zip_safe=False)
@@ -0,0 +1,27 @@
+"""
+Tests of what the package exposes
+"""
+import unittest
+
+import pma_python
+from pma_python import pma
+
+class ApiTest(unittest.TestCase):
+	def test_star_import(self):
+		names = dict()
+		exec("from pma_python import *", names)
+		# the pma submodule comes along as an attribute of the package
+		exported = set(names) - set(["__builtins__", "pma"])
+		self.assertEqual(exported, set(pma.__all__))
+		for name in ["np", "re", "time", "requests", "Image", "quote"]:
+			self.assertNotIn(name, exported)
+
+	def test_all_lists_the_module_functions(self):
+		client = pma.get_default_client()
+		bound = [name for (name, value) in vars(pma).items() if getattr(value, "__self__", None) is client]
+		self.assertEqual(sorted(set(bound) - set(pma.__all__)), [])
+		for name in pma.__all__:
+			self.assertIs(getattr(pma_python, name), getattr(pma, name))
+
+if __name__ == "__main__":
+	unittest.main()
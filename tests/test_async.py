@@ -0,0 +1,107 @@
+"""
+Tests of the asyncio API (aget_tile, aget_tiles, aget_slide_info) against the local stand-in PMA.core server of the benchmarks
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import fake_pmacore
+from pma_python import pma
+
+@unittest.skipIf(pma.aiohttp is None, "the asyncio API needs aiohttp")
+class AsyncApiTest(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.core = fake_pmacore.FakePmaCore(roots = 1, depth = 1, fanout = 1, slides_per_directory = 2, width = 2000, height = 1500)
+		(self.server, url) = fake_pmacore.start(self.core)
+		self.client = pma.PMAClient(backoff_factor = 0)
+		self.sessionID = self.client.connect(url, "test", "test")
+		self.slide = sorted(self.client.walk_slides(sessionID = self.sessionID))[0]
+		self.zoomlevel = self.client.get_max_zoomlevel(self.slide, self.sessionID)
+
+	async def asyncTearDown(self):
+		await self.client.aclose_connections()
+
+	def tearDown(self):
+		self.client.close()
+		self.server.shutdown()
+		self.server.server_close()
+
+	async def test_aget_tile(self):
+		tile = await self.client.aget_tile(self.slide, 1, 2, self.zoomlevel, self.sessionID, output = "bytes")
+		self.assertEqual(tile, self.client.get_tile(self.slide, 1, 2, self.zoomlevel, self.sessionID, output = "bytes"))
+		img = await self.client.aget_tile(self.slide, 1, 2, self.zoomlevel, self.sessionID)
+		self.assertEqual(img.size, (256, 256))
+
+	async def test_decode_off_event_loop(self):
+		threads = []
+		def decode(*args):
+			threads.append(threading.get_ident())
+			return decoder(*args)
+		decoder = pma._pma_decode_image
+		with mock.patch.object(pma, "_pma_decode_image", decode):
+			img = await self.client.aget_tile(self.slide, 1, 2, self.zoomlevel, self.sessionID, output = "numpy")
+		self.assertEqual(img.shape, (256, 256, 3))
+		self.assertEqual(len(threads), 1)
+		self.assertNotEqual(threads[0], threading.get_ident())
+
+	async def test_aget_tiles_ordered(self):
+		tiles = [t async for t in self.client.aget_tiles(self.slide, 0, 0, 3, 2, self.zoomlevel, self.sessionID, prefetch = 4, output = "bytes")]
+		expected = list(self.client.get_tiles(self.slide, 0, 0, 3, 2, self.zoomlevel, self.sessionID, output = "bytes"))
+		self.assertEqual(tiles, expected)
+
+	async def test_aget_tiles_unordered(self):
+		tiles = {(x, y): t async for (x, y, t) in self.client.aget_tiles(self.slide, 0, 0, 3, 2, self.zoomlevel, self.sessionID, ordered = False, output = "bytes")}
+		self.assertEqual(sorted(tiles.keys()), [(x, y) for x in range(3) for y in range(2)])
+		for ((x, y), tile) in tiles.items():
+			self.assertEqual(tile, self.client.get_tile(self.slide, x, y, self.zoomlevel, self.sessionID, output = "bytes"))
+
+	async def test_aget_slide_info(self):
+		info = await self.client.aget_slide_info(self.slide, self.sessionID)
+		self.assertEqual(info["Width"], 2000)
+		self.assertEqual(info["Height"], 1500)
+		self.assertEqual(info, self.client.get_slide_info(self.slide, self.sessionID))
+
+	async def test_slide_info_store_off_event_loop(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.client.set_slide_info_cache(path = os.path.join(directory.name, "slideinfo.db"))
+		self.addCleanup(self.client.set_slide_info_cache, path = None)
+		self.client.invalidate_slide_info(sessionID = self.sessionID)
+		threads = []
+		def store(*args):
+			threads.append(threading.get_ident())
+			return stored(*args)
+		stored = self.client._store_slide_info
+		with mock.patch.object(self.client, "_store_slide_info", store):
+			info = await self.client.aget_slide_info(self.slide, self.sessionID)
+		self.assertEqual(len(threads), 1)
+		self.assertNotEqual(threads[0], threading.get_ident())
+		self.assertEqual(self.client._stored_slide_info(self.slide, self.sessionID), info)
+
+	async def test_retry(self):
+		self.core.failures = 2
+		tile = await self.client.aget_tile(self.slide, 0, 0, self.zoomlevel, self.sessionID, output = "bytes")
+		self.assertEqual(tile, self.client.get_tile(self.slide, 0, 0, self.zoomlevel, self.sessionID, output = "bytes"))
+		metrics = self.client.get_metrics(self.sessionID)["tile"]
+		self.assertEqual(metrics["retries"], 2)
+		self.assertEqual(metrics["errors"], 0)
+
+	async def test_retries_exhausted(self):
+		self.client.set_connection_options(retries = 1)
+		self.core.failures = 2
+		with self.assertRaises(Exception):
+			await self.client.aget_tile(self.slide, 0, 0, self.zoomlevel, self.sessionID)
+		self.assertEqual(self.client.get_metrics(self.sessionID)["tile"]["errors"], 1)
+
+	async def test_failed_tile_raises(self):
+		self.client.set_connection_options(retries = 1)
+		self.core.failures = 2
+		with self.assertRaisesRegex(Exception, "tile request .* HTTP status 503"):
+			await self.client.aget_tile(self.slide, 0, 0, self.zoomlevel, self.sessionID, output = "bytes")
+
+if __name__ == "__main__":
+	unittest.main()
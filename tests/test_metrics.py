@@ -0,0 +1,46 @@
+"""
+Tests of the bytes that get_metrics reports, against the local stand-in PMA.core server of the benchmarks
+"""
+import gzip
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import fake_pmacore
+from pma_python import pma
+
+class WireBytesTest(unittest.TestCase):
+	def serve(self, compress, chunked):
+		core = fake_pmacore.FakePmaCore(roots = 200, depth = 0, compress = compress, chunked = chunked)
+		(server, url) = fake_pmacore.start(core)
+		self.addCleanup(server.server_close)
+		self.addCleanup(server.shutdown)
+		client = pma.PMAClient()
+		self.addCleanup(client.close)
+		sessionID = client.connect(url, "test", "test")
+		self.assertEqual(client.get_root_directories(sessionID), core.roots)
+		body = json.dumps(core.roots).encode("utf-8")
+		return (client.get_metrics(sessionID)["GetRootDirectories"]["bytes"], body)
+
+	def test_content_length(self):
+		(nbytes, body) = self.serve(compress = False, chunked = False)
+		self.assertEqual(nbytes, len(body))
+
+	def test_content_length_gzip(self):
+		(nbytes, body) = self.serve(compress = True, chunked = False)
+		self.assertEqual(nbytes, len(gzip.compress(body)))
+		self.assertLess(nbytes, len(body))
+
+	def test_chunked(self):
+		(nbytes, body) = self.serve(compress = False, chunked = True)
+		self.assertEqual(nbytes, len(body))
+
+	def test_chunked_gzip(self):
+		# there's no telling how big a chunked, encoded body was on the wire; it's counted at its decoded size rather than as 0
+		(nbytes, body) = self.serve(compress = True, chunked = True)
+		self.assertEqual(nbytes, len(body))
+
+if __name__ == "__main__":
+	unittest.main()
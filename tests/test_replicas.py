@@ -0,0 +1,122 @@
+"""
+Tests of replica sets (connect_replicas) against several local stand-in PMA.core servers of the benchmarks
+"""
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import fake_pmacore
+from pma_python import pma
+
+class ReplicaTest(unittest.TestCase):
+	def setUp(self):
+		self.cores, self.servers, self.urls = [], [], []
+		for i in range(3):
+			core = fake_pmacore.FakePmaCore(roots = 1, depth = 1, fanout = 1, slides_per_directory = 1, width = 2000, height = 1500)
+			(server, url) = fake_pmacore.start(core)
+			self.cores.append(core)
+			self.servers.append(server)
+			self.urls.append(url)
+		self.client = pma.PMAClient(retries = 0, backoff_factor = 0)
+
+	def tearDown(self):
+		self.client.close()
+		for server in self.servers:
+			server.shutdown()
+			server.server_close()
+
+	def connect(self, max_errors = 2, eject_seconds = 60):
+		sessionID = self.client.connect_replicas(self.urls, "test", "test", max_errors = max_errors, eject_seconds = eject_seconds)
+		self.slide = sorted(self.client.walk_slides(sessionID = sessionID))[0]
+		self.zoomlevel = self.client.get_max_zoomlevel(self.slide, sessionID)
+		return sessionID
+
+	def fetch(self, sessionID, n = 12, workers = 1):
+		tiles = self.client.get_tiles(self.slide, 0, 0, n, 1, self.zoomlevel, sessionID, workers = workers, output = "bytes")
+		self.assertTrue(all(len(tile) > 0 for tile in tiles))
+
+	def requests(self):
+		return [core.requests for core in self.cores]
+
+	def test_balancing(self):
+		sessionID = self.connect()
+		for core in self.cores:
+			core.latency = 0.02
+		before = self.requests()
+		self.fetch(sessionID, 8, workers = 6)
+		after = self.requests()
+		self.assertTrue(all(b > a for (a, b) in zip(before, after)), (before, after))
+		status = self.client.get_replica_status(sessionID)
+		self.assertEqual([s["url"] for s in status], self.urls)
+		self.assertTrue(all(s["healthy"] and s["errors"] == 0 for s in status))
+
+	def test_slow_node_gets_less(self):
+		sessionID = self.connect()
+		for core in self.cores:
+			core.latency = 0.01
+		self.cores[0].latency = 0.2
+		self.fetch(sessionID, 3, workers = 3)
+		before = self.requests()
+		self.fetch(sessionID, 30, workers = 3)
+		counts = [b - a for (a, b) in zip(before, self.requests())]
+		self.assertEqual(sum(counts), 30)
+		self.assertLess(counts[0], min(counts[1:]))
+
+	def test_ejection(self):
+		sessionID = self.connect(max_errors = 1)
+		for core in self.cores:
+			core.latency = 0.02
+		self.cores[1].failures = 1000
+		# requests that fail on the node are retried on another one
+		self.fetch(sessionID, workers = 6)
+		status = self.client.get_replica_status(sessionID)
+		self.assertEqual([s["healthy"] for s in status], [True, False, True])
+		self.assertGreaterEqual(status[1]["errors"], 1)
+		# an ejected node takes no more traffic
+		before = self.requests()
+		self.fetch(sessionID)
+		after = self.requests()
+		self.assertEqual(after[1], before[1])
+		self.assertEqual(sum(after) - sum(before), 12)
+
+	def test_recheck(self):
+		sessionID = self.connect(max_errors = 1, eject_seconds = 0.2)
+		for core in self.cores:
+			core.latency = 0.02
+		self.cores[2].failures = 1
+		self.fetch(sessionID, workers = 6)
+		self.assertFalse(self.client.get_replica_status(sessionID)[2]["healthy"])
+		time.sleep(0.3)
+		before = self.requests()
+		self.fetch(sessionID, workers = 6)
+		status = self.client.get_replica_status(sessionID)
+		self.assertTrue(status[2]["healthy"])
+		self.assertGreater(self.requests()[2], before[2])
+
+	def test_all_nodes_failed(self):
+		sessionID = self.connect()
+		for core in self.cores:
+			core.failures = 1000
+		with self.assertRaisesRegex(Exception, "HTTP status 503"):
+			self.client.get_tile(self.slide, 0, 0, self.zoomlevel, sessionID, output = "bytes")
+		self.assertEqual([s["errors"] for s in self.client.get_replica_status(sessionID)], [1, 1, 1])
+		self.assertEqual(self.client.get_metrics(sessionID)["tile"]["errors"], 3)
+		# once the nodes recover, the session works again
+		for core in self.cores:
+			core.failures = 0
+		self.fetch(sessionID)
+
+	def test_unreachable_node(self):
+		self.servers[0].shutdown()
+		self.servers[0].server_close()
+		self.servers.pop(0)
+		sessionID = self.connect()
+		status = self.client.get_replica_status(sessionID)
+		self.assertEqual([s["url"] for s in status], [self.urls[1], self.urls[0], self.urls[2]])
+		self.assertEqual([s["healthy"] for s in status], [True, False, True])
+		self.fetch(sessionID)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,47 @@
+"""
+Tests of sample_patches against the local stand-in PMA.core server of the benchmarks
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import fake_pmacore
+from pma_python import pma
+
+class SamplePatchesTest(unittest.TestCase):
+	def setUp(self):
+		self.core = fake_pmacore.FakePmaCore(roots = 1, depth = 1, fanout = 1, slides_per_directory = 6, width = 1000, height = 800)
+		(self.server, url) = fake_pmacore.start(self.core)
+		self.client = pma.PMAClient(backoff_factor = 0)
+		self.sessionID = self.client.connect(url, "test", "test")
+		self.slides = sorted(self.client.walk_slides(sessionID = self.sessionID))
+
+	def tearDown(self):
+		self.client.close()
+		self.server.shutdown()
+		self.server.server_close()
+
+	def locations(self, **kwargs):
+		return [locations for (patches, locations) in self.client.sample_patches(self.slides, sessionID = self.sessionID, **kwargs)]
+
+	def test_random_is_deterministic(self):
+		batches = self.locations(size = 64, patches_per_slide = 4, batch_size = 8, seed = 3, workers = 8)
+		self.assertEqual(batches, self.locations(size = 64, patches_per_slide = 4, batch_size = 8, seed = 3, workers = 1))
+		self.assertNotEqual(batches, self.locations(size = 64, patches_per_slide = 4, batch_size = 8, seed = 4, workers = 8))
+		self.assertEqual([len(b) for b in batches], [8, 8, 8])
+
+	def test_random_batches_mix_slides(self):
+		batches = self.locations(size = 64, patches_per_slide = 8, batch_size = 8)
+		self.assertEqual(sorted(l[0] for b in batches for l in b), sorted(self.slides * 8))
+		for batch in batches:
+			self.assertGreater(len(set(l[0] for l in batch)), 1)
+
+	def test_grid(self):
+		(patches, locations) = next(self.client.sample_patches(self.slides, size = 256, strategy = "grid", batch_size = 12, sessionID = self.sessionID))
+		self.assertEqual(patches.shape, (12, 256, 256, 3))
+		self.assertEqual([l[0] for l in locations], [self.slides[0]] * 9 + [self.slides[1]] * 3)
+		self.assertEqual([(l[2], l[3]) for l in locations[:4]], [(0, 0), (256, 0), (512, 0), (0, 256)])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,67 @@
+"""
+Tests of the slide information caches against the local stand-in PMA.core server of the benchmarks
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import fake_pmacore
+from pma_python import pma
+
+class SlideInfoTest(unittest.TestCase):
+	def setUp(self):
+		self.core = fake_pmacore.FakePmaCore(roots = 1, depth = 1, fanout = 1, slides_per_directory = 8, width = 2000, height = 1500)
+		(self.server, self.url) = fake_pmacore.start(self.core)
+		self.client = pma.PMAClient(backoff_factor = 0)
+		self.sessionID = self.client.connect(self.url, "test", "test")
+		self.slides = sorted(self.client.walk_slides(sessionID = self.sessionID))
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+
+	def tearDown(self):
+		self.client.set_slide_info_cache(path = None)
+		self.client.close()
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_store_survives_new_client(self):
+		path = os.path.join(self.directory.name, "slideinfo.db")
+		self.client.set_slide_info_cache(path = path)
+		info = self.client.get_slide_info(self.slides[0], self.sessionID)
+		client = pma.PMAClient()
+		self.addCleanup(client.close)
+		client.set_slide_info_cache(path = path)
+		sessionID = client.connect(self.url, "test", "test")
+		self.assertEqual(client.get_slide_info(self.slides[0], sessionID), info)
+		metrics = client.get_metrics(sessionID)["GetImageInfo"]
+		self.assertEqual((metrics["requests"], metrics["cache_hits"]), (0, {"disk": 1}))
+		client.set_slide_info_cache(path = None)
+
+	def test_reconfigure_while_in_use(self):
+		errors = []
+		done = threading.Event()
+		def read():
+			try:
+				while not done.is_set():
+					for slide in self.slides:
+						self.client.invalidate_slide_info(slide, self.sessionID)
+						self.assertEqual(self.client.get_slide_info(slide, self.sessionID)["Width"], 2000)
+			except Exception as e:
+				errors.append(e)
+		threads = [threading.Thread(target = read) for i in range(4)]
+		for thread in threads:
+			thread.start()
+		for i in range(20):
+			self.client.set_slide_info_cache(path = os.path.join(self.directory.name, str(i % 3) + ".db") if i % 4 else None)
+			self.client.set_tile_disk_cache(self.directory.name if i % 2 else None)
+			self.client.set_tile_memory_cache(1024 ** 2 if i % 2 else None)
+		done.set()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(errors, [])
+
+if __name__ == "__main__":
+	unittest.main()
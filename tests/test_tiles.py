@@ -0,0 +1,59 @@
+"""
+Tests of tile and region reads against the local stand-in PMA.core server of the benchmarks
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import fake_pmacore
+from pma_python import pma
+
+class TileTest(unittest.TestCase):
+	def setUp(self):
+		self.core = fake_pmacore.FakePmaCore(roots = 1, depth = 1, fanout = 1, slides_per_directory = 1, width = 2000, height = 1500)
+		(self.server, url) = fake_pmacore.start(self.core)
+		self.client = pma.PMAClient(retries = 1, backoff_factor = 0)
+		self.sessionID = self.client.connect(url, "test", "test")
+		self.slide = self.client.get_slides(self.client.get_directories(self.client.get_root_directories(self.sessionID)[0], self.sessionID)[0], self.sessionID)[0]
+		self.zoomlevel = self.client.get_max_zoomlevel(self.slide, self.sessionID)
+
+	def tearDown(self):
+		self.client.close()
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_failed_tile_raises(self):
+		self.core.failures = 10
+		with self.assertRaisesRegex(Exception, "tile request .* HTTP status 503"):
+			self.client.get_tile(self.slide, 0, 0, self.zoomlevel, self.sessionID, output = "bytes")
+		self.core.failures = 10
+		with self.assertRaisesRegex(Exception, "HTTP status 503"):
+			list(self.client.get_tiles(self.slide, 0, 0, 2, 2, self.zoomlevel, self.sessionID, output = "bytes"))
+		self.core.failures = 0
+		self.assertGreater(len(self.client.get_tile(self.slide, 0, 0, self.zoomlevel, self.sessionID, output = "bytes")), 0)
+
+	def test_failed_tile_not_cached(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.client.set_tile_disk_cache(directory.name)
+		self.core.failures = 10
+		with self.assertRaises(Exception):
+			self.client.get_tile(self.slide, 1, 1, self.zoomlevel, self.sessionID, output = "bytes")
+		self.core.failures = 0
+		self.assertGreater(len(self.client.get_tile(self.slide, 1, 1, self.zoomlevel, self.sessionID, output = "bytes")), 0)
+
+	def test_region_clipped_to_slide(self):
+		region = self.client.get_region(self.slide, 1900, 1400, 300, 300, sessionID = self.sessionID)
+		self.assertEqual(region.shape, (300, 300, 3))
+		self.assertTrue(region[:100, :100].any())
+		self.assertFalse(region[100:].any())
+		self.assertFalse(region[:, 100:].any())
+		out = self.client.get_region(self.slide, 1536, 1280, 512, 512, sessionID = self.sessionID)
+		self.assertTrue(out[:220, :464].any())
+		self.assertFalse(out[220:].any())
+		self.assertFalse(out[:, 464:].any())
+
+if __name__ == "__main__":
+	unittest.main()